@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+# Copyright 2024 Hewlett Packard Enterprise Development LP
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of version 2 of the GNU General Public License as published
+# by the Free Software Foundation.
+
+"""
+Compare cold-start time and peak RSS of loading the fwget index from
+~/.fwget.json against the memory-mapped ~/.fwget.bin, for a synthetic index.
+
+Usage:
+  bench_index.py [entries] [runs]     # default: 50000 entries, 5 runs
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+FWGET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, FWGET_DIR)
+import fwget  # noqa: E402
+
+# Each child process loads the index, reads one entry, and reports its time and peak RSS
+LOADERS = {
+    "json": """
+with open(json_filename, "r", encoding="utf-8") as json_index_file:
+    index = json.load(json_index_file)
+""",
+    "binary": """
+index = fwget.FWBinaryIndex.open(binary_filename, "bench")
+""",
+}
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {fwget_dir!r})
+import fwget
+json_filename, binary_filename, name = {json_filename!r}, {binary_filename!r}, {name!r}
+start = time.perf_counter()
+{loader}
+entry = index[name]
+fields = (entry["date"], entry["description"], entry["target"], entry["deviceclass"])
+elapsed = time.perf_counter() - start
+# VmHWM belongs to this process image; ru_maxrss would include the parent's peak from before exec
+with open("/proc/self/status", encoding="utf-8") as status:
+    maxrss = next(line.split()[1] for line in status if line.startswith("VmHWM:"))
+print(elapsed, maxrss)
+"""
+
+
+def synthetic_index(entries):
+    classes = ["SystemROM", "NIC", "Storage", "SystemBMC", "PowerSupply"]
+    index = {}
+    for i in range(entries):
+        name = f"U{i % 97}_{i // 97}.{i % 3:02d}_{(i % 28) + 1:02d}_2024.fwpkg"
+        index[name] = {
+            "date": f"20{18 + i % 7}-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}",
+            "description": f"ROM Flash Firmware Package - HPE ProLiant DL{300 + i % 90} Gen{9 + i % 4} Servers (U{i % 97})",
+            "target": [f"{i:08x}-0000-4000-8000-{i * 7919 % 10**12:012d}"],
+            "deviceclass": classes[i % len(classes)],
+        }
+    return index
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as workdir:
+        index = synthetic_index(entries)
+        json_filename = os.path.join(workdir, ".fwget.json")
+        binary_filename = os.path.join(workdir, ".fwget.bin")
+        with open(json_filename, "w", encoding="utf-8") as json_index_file:
+            json.dump(index, json_index_file)
+        fwget.FWBinaryIndex.write(binary_filename, index, "bench")
+        name = list(index)[entries // 2]
+
+        print(f"{entries} entries: .fwget.json {os.path.getsize(json_filename)} bytes, "
+              f".fwget.bin {os.path.getsize(binary_filename)} bytes")
+        print("format".ljust(10) + "cold start (ms)".rjust(18) + "peak RSS (KiB)".rjust(18))
+        for label, loader in LOADERS.items():
+            child = CHILD.format(
+                fwget_dir=FWGET_DIR,
+                json_filename=json_filename,
+                binary_filename=binary_filename,
+                name=name,
+                loader=loader,
+            )
+            times, rss = [], []
+            for _ in range(runs):
+                output = subprocess.run([sys.executable, "-c", child], check=True, capture_output=True, text=True)
+                elapsed, maxrss = output.stdout.split()
+                times.append(float(elapsed) * 1000)
+                rss.append(int(maxrss))
+            print(label.ljust(10) + f"{statistics.median(times):.2f}".rjust(18) + f"{statistics.median(rss)}".rjust(18))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+# Copyright 2024 Hewlett Packard Enterprise Development LP
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of version 2 of the GNU General Public License as published
+# by the Free Software Foundation.
+
+"""
+Measure the startup time of fwget and fwlist for commands that need no
+network, and check that they do not load the network stack.
+
+Every command runs in a fresh interpreter, after the cached index has been
+primed from a local synthetic repository.  The bare interpreter startup is
+measured too, for reference.  Exits with 1 when a command loaded requests or
+urllib3, or when its median exceeds --max-ms.
+
+Usage:
+  bench_startup.py [--runs <n>] [--entries <n>] [--max-ms <ms>]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FWGET_PATH = os.path.join(BENCH_DIR, "..", "fwget.py")
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+import fwget  # noqa: E402
+from bench_index import synthetic_index  # noqa: E402
+from fwbench import SDRHandler, start_server  # noqa: E402
+
+NETWORK_MODULES = ("requests", "urllib3", "multiprocessing")
+
+# Runs fwget.py as __main__ under the name given, then lists the network modules it loaded
+CHILD = """
+import atexit, os, runpy, sys
+
+def report_modules():
+    loaded = [name for name in os.environ["FWBENCH_MODULES"].split(",") if name in sys.modules]
+    with open(os.environ["FWBENCH_REPORT"], "w", encoding="utf-8") as report:
+        report.write(",".join(loaded))
+
+atexit.register(report_modules)
+sys.argv = sys.argv[1:]
+runpy.run_path(os.environ["FWBENCH_FWGET"], run_name="__main__")
+"""
+
+COMMANDS = [
+    ["fwget", "-v"],
+    ["fwget", "-h"],
+    ["fwlist", "-h"],
+    ["fwget", "search", "DL380", "--offline"],
+    ["fwget", "locate", "DL380", "--offline"],
+    ["fwget", "list", "--offline"],
+]
+
+
+def main():
+    _, options = fwget.split_options(sys.argv[1:], ("runs", "entries", "max-ms"))
+    runs = int(options.get("runs", 20))
+    max_ms = float(options["max-ms"]) if options.get("max-ms") else None
+
+    index = synthetic_index(int(options.get("entries", 10000)))
+    sdr = start_server(
+        SDRHandler, latency=0, index_body=json.dumps(index).encode("utf-8"), index_etag='"startup"', names=set(index), blob=b""
+    )
+    failures = 0
+    with tempfile.TemporaryDirectory() as home:
+        with open(os.path.join(home, ".fwget.conf"), "w", encoding="utf-8") as config:
+            json.dump(
+                {"sdr_url": "http://127.0.0.1:%d" % sdr.server_address[1], "sdr_allow_http": "yes", "token": "na"}, config
+            )
+        report_file = os.path.join(home, "modules")
+        environment = dict(
+            os.environ,
+            HOME=home,
+            FWBENCH_FWGET=FWGET_PATH,
+            FWBENCH_MODULES=",".join(NETWORK_MODULES),
+            FWBENCH_REPORT=report_file,
+        )
+        # Prime ~/.fwget.json and its binary and search indexes
+        subprocess.run(
+            [sys.executable, "-c", CHILD, "fwget", "search", "DL380"], env=environment, check=True, stdout=subprocess.DEVNULL
+        )
+
+        print("command".ljust(34) + "median ms".rjust(11) + "p90 ms".rjust(11) + "   network modules")
+        for command in [None] + COMMANDS:
+            samples = []
+            for _ in range(runs):
+                arguments = [sys.executable, "-c", "pass"] if command is None else [sys.executable, "-c", CHILD] + command
+                start = time.perf_counter()
+                subprocess.run(arguments, env=environment, check=True, stdout=subprocess.DEVNULL)
+                samples.append(time.perf_counter() - start)
+            median = statistics.median(samples) * 1000
+            p90 = sorted(samples)[int(0.9 * (len(samples) - 1))] * 1000
+            loaded = ""
+            if command is not None:
+                with open(report_file, encoding="utf-8") as f:
+                    loaded = f.read()
+            slow = max_ms is not None and command is not None and median > max_ms
+            failures += bool(loaded) or slow
+            name = "python (interpreter only)" if command is None else " ".join(command)
+            print(
+                name.ljust(34) + f"{median:.1f}".rjust(11) + f"{p90:.1f}".rjust(11)
+                + "   " + (loaded or "-") + ("   SLOW" if slow else "")
+            )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/python3
+
+# Copyright 2024 Hewlett Packard Enterprise Development LP
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of version 2 of the GNU General Public License as published
+# by the Free Software Foundation.
+
+"""
+Offline benchmark of fwget and fwlist against local stand-in servers.
+
+A local HTTP server plays the SDR repository: a synthetic
+fwrepodata/fwrepo.json plus a package blob for every entry, with ETag and
+Range support.  A second one plays an iLO: Redfish sessions and the
+FirmwareInventory collection and members.  Both can inject latency.
+
+fwget search, locate, list and download are timed end to end, as separate
+processes, and per phase in this process; fwlist is timed per phase, as
+iLOs only serve Redfish on https port 443.  The report gives latency
+percentiles, throughput and peak RSS for each.
+
+Usage:
+  fwbench.py [--entries <n>] [--runs <n>] [--members <n>] [--blob-size <bytes>]
+             [--sdr-latency <ms>] [--redfish-latency <ms>] [--expand] [--json <file>]
+
+  --entries          entries in the synthetic fwrepo.json (default: 10000, 1000 to 100000 is typical)
+  --runs             repetitions of every measurement (default: 10)
+  --members          FirmwareInventory members of the mock iLO (default: 40)
+  --blob-size        size of every package blob (default: 1048576)
+  --sdr-latency      latency added to every SDR request, in ms (default: 0)
+  --redfish-latency  latency added to every Redfish request, in ms (default: 0)
+  --expand           let the mock iLO answer $expand queries
+  --json             also write the results to <file> as JSON, for regression tracking
+"""
+
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FWGET_PATH = os.path.join(BENCH_DIR, "..", "fwget.py")
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+import fwget  # noqa: E402
+from bench_index import synthetic_index  # noqa: E402
+
+INVENTORY = "/redfish/v1/UpdateService/FirmwareInventory/"
+SESSIONS = "/redfish/v1/SessionService/Sessions"
+
+# Runs fwget.py as __main__ and records the peak RSS of the process on exit
+CLI_WRAPPER = """
+import atexit, os, runpy, sys
+
+def report_rss():
+    with open("/proc/self/status", encoding="utf-8") as status:
+        maxrss = next(line.split()[1] for line in status if line.startswith("VmHWM:"))
+    with open(os.environ["FWBENCH_RSS"], "w", encoding="utf-8") as rss_file:
+        rss_file.write(maxrss)
+
+atexit.register(report_rss)
+sys.argv = ["fwget"] + sys.argv[2:]
+runpy.run_path(os.environ["FWBENCH_FWGET"], run_name="__main__")
+"""
+
+
+class SDRHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if path == "/fwrepodata/fwrepo.json":
+            body, etag = self.server.index_body, self.server.index_etag
+        elif path.lstrip("/") in self.server.names:
+            body, etag = self.server.blob, '"blob"'
+        elif path.lstrip("/").replace(".json", ".fwpkg") in self.server.names:
+            # The decoupled JSON file that goes with every .fwpkg
+            body, etag = b"{}", '"companion"'
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        byte_range = self.headers.get("Range", "")
+        if byte_range.startswith("bytes="):
+            start = int(byte_range[len("bytes="):].split("-")[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class RedfishHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def member(self, number):
+        return {
+            "@odata.id": f"{INVENTORY}{number}/",
+            "@odata.etag": f'W/"{number:08X}"',
+            "Name": f"Component {number}",
+            "Description": f"Device {number}",
+            "Version": f"1.{number} Jan 01 2024",
+            "Oem": {"Hpe": {"Targets": [f"00000000-0000-0000-0000-{number:012d}"]}},
+        }
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != SESSIONS:
+            return self.reply(404, {})
+        token = uuid.uuid4().hex
+        self.server.tokens.add(token)
+        host, port = self.server.server_address
+        location = f"http://{host}:{port}{SESSIONS}/{token}/"
+        self.reply(201, {}, {"X-Auth-Token": token, "Location": location})
+
+    def do_DELETE(self):
+        time.sleep(self.server.latency)
+        self.server.tokens.discard(self.path.rstrip("/").rsplit("/", 1)[-1])
+        self.reply(200, {})
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.headers.get("X-Auth-Token") not in self.server.tokens:
+            return self.reply(401, {})
+        path, _, query = self.path.partition("?")
+        if path.startswith(SESSIONS + "/"):
+            return self.reply(200, {"Id": path.rstrip("/").rsplit("/", 1)[-1]})
+        if path == INVENTORY and "$expand" in urllib.parse.unquote(query):
+            if not self.server.expand:
+                return self.reply(400, {})
+            return self.reply(200, {"Members": [self.member(n) for n in range(self.server.members)]})
+        if path == INVENTORY:
+            members = [{"@odata.id": f"{INVENTORY}{n}/"} for n in range(self.server.members)]
+            return self.reply(200, {"@odata.etag": 'W/"inventory"', "Members": members})
+        if path.startswith(INVENTORY):
+            number = int(path.rstrip("/").rsplit("/", 1)[-1])
+            if number < self.server.members:
+                member = self.member(number)
+                if self.headers.get("If-None-Match") == member["@odata.etag"]:
+                    return self.reply(304, headers={"ETag": member["@odata.etag"]})
+                return self.reply(200, member)
+        self.reply(404, {})
+
+
+def start_server(handler, **attributes):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(name, samples, rss=None, transferred=None):
+    mean = statistics.mean(samples)
+    result = {
+        "name": name,
+        "runs": len(samples),
+        "mean_ms": mean * 1000,
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p90_ms": percentile(samples, 0.90) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "ops_per_s": 1 / mean if mean else 0,
+    }
+    if transferred:
+        result["mib_per_s"] = transferred / mean / (1024 * 1024) if mean else 0
+    if rss:
+        result["peak_rss_kib"] = max(rss)
+    return result
+
+
+def timed(function, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_cli(home, workdir, runs, names, term):
+    """
+    time fwget commands end to end, each run a separate process
+    """
+    results = []
+    commands = [
+        ("cli search", ["search", term]),
+        ("cli locate", ["locate", term]),
+        ("cli list", ["list"]),
+        ("cli download", ["download", names[0]]),
+    ]
+    environment = dict(os.environ, HOME=home, FWBENCH_FWGET=FWGET_PATH)
+    for name, arguments in commands:
+        samples, rss = [], []
+        for _ in range(runs):
+            rss_file = os.path.join(home, "rss")
+            environment["FWBENCH_RSS"] = rss_file
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "-c", CLI_WRAPPER, "fwget"] + arguments,
+                cwd=workdir, env=environment, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            samples.append(time.perf_counter() - start)
+            with open(rss_file, encoding="utf-8") as f:
+                rss.append(int(f.read()))
+        results.append(summarize(name, samples, rss))
+    return results
+
+
+def bench_fwget_phases(runs, names, term, blob_size, workdir):
+    """
+    time the phases of fwget in this process
+    """
+    results = []
+    fwget_home = os.path.expanduser("~")
+
+    def parse_config_cold():
+        for cache in (".fwget.json", ".fwget.meta", ".fwget.bin", ".fwget.idx"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(fwget_home, cache))
+        new_fwget().parse_config()
+
+    def new_fwget(*arguments):
+        with contextlib.redirect_stdout(io.StringIO()):
+            instance = fwget.FWGet(["fwget"] + list(arguments))
+            instance.parse_config()
+        return instance
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.append(summarize("index fetch, cold", timed(parse_config_cold, max(1, runs // 5))))
+        results.append(summarize("index revalidate (304)", timed(lambda: new_fwget(), runs)))
+        results.append(summarize("index load, offline", timed(lambda: new_fwget("--offline"), runs)))
+
+    instance = new_fwget()
+    index = instance.fwget_json_index
+    results.append(summarize("search_index", timed(lambda: instance.search_index(term, index), runs)))
+    results.append(summarize("locate_index", timed(lambda: instance.locate_index(term, index), runs)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.append(summarize("list output", timed(lambda: instance.list(index), runs)))
+
+    instance.package_cache = "no"
+    target = os.path.join(workdir, names[0])
+
+    def download():
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            instance.download_file(names[0], instance.package_url(names[0], instance.content_url), target)
+        os.remove(target)
+
+    results.append(summarize("download transfer", timed(download, runs), transferred=blob_size))
+    return results
+
+
+def bench_fwlist_phases(runs, address, workdir):
+    """
+    time the phases of fwlist against the mock iLO in this process
+    """
+    phases = {"redfish login": [], "firmware_parse and export": [], "redfish logout": [], "fwlist total": []}
+    calls = []
+    for _ in range(runs):
+        fwlist = fwget.FWList(["fwlist", "json_display"])
+        fwlist.ilo_scheme = "http"
+        fwlist.ilo_address = address
+        fwlist.username, fwlist.password = "bench", "bench"
+        fwlist.odataid_file = os.path.join(workdir, ".fwlist.output")
+        session = fwlist.redfish_session()
+        session.session.hooks["response"].append(lambda response, *args, **kwargs: calls.append(response.elapsed.total_seconds()))
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            fwlist.redfish_connect(session)
+            login = time.perf_counter()
+            # Components are exported while they are parsed, so both are timed together
+            fwlist.odataid_export(session, fwlist.session_url, fwlist.fwlist_odataid_output_format)
+            exported = time.perf_counter()
+            fwlist.redfish_disconnect(session)
+        end = time.perf_counter()
+        phases["redfish login"].append(login - start)
+        phases["firmware_parse and export"].append(exported - login)
+        phases["redfish logout"].append(end - exported)
+        phases["fwlist total"].append(end - start)
+    results = [summarize(name, samples) for name, samples in phases.items()]
+    results.append(summarize("redfish call", calls))
+    return results
+
+
+def main():
+    _, options = fwget.split_options(
+        sys.argv[1:], ("entries", "runs", "members", "blob-size", "sdr-latency", "redfish-latency", "json")
+    )
+    entries = int(options.get("entries", 10000))
+    runs = int(options.get("runs", 10))
+    members = int(options.get("members", 40))
+    blob_size = int(options.get("blob-size", 1024 * 1024))
+
+    index = synthetic_index(entries)
+    names = list(index)
+    sdr = start_server(
+        SDRHandler,
+        latency=float(options.get("sdr-latency", 0)) / 1000,
+        index_body=json.dumps(index).encode("utf-8"),
+        index_etag=f'"{uuid.uuid4().hex}"',
+        names=set(names),
+        blob=os.urandom(blob_size),
+    )
+    ilo = start_server(
+        RedfishHandler,
+        latency=float(options.get("redfish-latency", 0)) / 1000,
+        members=members,
+        expand=bool(options.get("expand")),
+        tokens=set(),
+    )
+    sdr_url = "http://127.0.0.1:%d" % sdr.server_address[1]
+    ilo_address = "127.0.0.1:%d" % ilo.server_address[1]
+    term = "DL380"
+
+    with tempfile.TemporaryDirectory() as home, tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(home, ".fwget.conf"), "w", encoding="utf-8") as config:
+            json.dump({"sdr_url": sdr_url, "sdr_allow_http": "yes", "token": "na", "index_max_age": 0, "package_cache": "no"}, config)
+        os.environ["HOME"] = home
+
+        print(f"{entries} index entries, {members} inventory members, {blob_size} byte packages, {runs} runs\n")
+        results = bench_fwget_phases(runs, names, term, blob_size, workdir)
+        results += bench_fwlist_phases(runs, ilo_address, workdir)
+        results += bench_cli(home, workdir, runs, names, term)
+
+    print(
+        "measurement".ljust(26)
+        + "".join(column.rjust(11) for column in ("mean ms", "p50 ms", "p90 ms", "p99 ms", "ops/s", "MiB/s", "RSS KiB"))
+    )
+    for result in results:
+        print(
+            result["name"].ljust(26)
+            + "".join(f"{result[key]:.2f}".rjust(11) for key in ("mean_ms", "p50_ms", "p90_ms", "p99_ms", "ops_per_s"))
+            + (f"{result['mib_per_s']:.1f}" if "mib_per_s" in result else "-").rjust(11)
+            + str(result.get("peak_rss_kib", "-")).rjust(11)
+        )
+
+    if options.get("json"):
+        with open(options["json"], "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
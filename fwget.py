@@ -18,19 +18,53 @@
 #  51 Franklin Street, Fifth Floor
 #  Boston, MA 02110-1301, USA.
 
+import atexit
+import contextlib
+import hashlib
+import heapq
+import io
 import json
+import mmap
 import os
 import os.path
-from pprint import pprint
 import sys
 import re
 import ipaddress
+import shutil
+import struct
+import threading
+import time
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-try:
-    import requests
-except ImportError:
-    sys.exit(
-        """
+# Define the version of fwget/fwlist
+FWGET_VER = "1.0.5"
+
+# Global string variable
+FWLIST = "fwlist"
+FWGET = "fwget"
+
+# The network stack is imported by import_requests() on first use, so that
+# -v, -h and commands served from the cached index start quickly
+requests = None
+urllib3 = None
+requests_lock = threading.Lock()  # fleet threads may all need it at once
+
+
+def import_requests():
+    """
+    import requests and urllib3 into the module globals, once
+    """
+    global requests, urllib3
+    with requests_lock:
+        if requests is not None:
+            return requests
+        try:
+            import requests as requests_module
+        except ImportError:
+            sys.exit(
+                """
 Fwget requries the 'requests' Python module.
 Please install it with the appropriate command as root:
 
@@ -39,21 +73,15 @@ Please install it with the appropriate command as root:
                 Ubuntu:    apt-get install python3-requests
                 others:    pip     install requests
                                          """
-    )
-from urllib.request import getproxies
-import urllib3
-# Define the version of fwget/fwlist
-FWGET_VER = "1.0.5"
+            )
+        import urllib3 as urllib3_module
 
-# Flag to enable or disable debug mode
-DEBUG = False
-
-# Global string variable
-FWLIST = "fwlist"
-FWGET = "fwget"
-
-# Disable SSL warnings for self-signed certificates
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        # Disable SSL warnings for self-signed certificates
+        urllib3_module.disable_warnings(urllib3_module.exceptions.InsecureRequestWarning)
+        if TIMINGS.enabled:
+            TIMINGS.instrument_connections(urllib3_module)
+        requests, urllib3 = requests_module, urllib3_module
+        return requests
 
 gen_for_old_fwpkg = [
     r"/fwpp/",
@@ -63,6 +91,1185 @@ gen_for_old_fwpkg = [
     r"/fwpp-gen11/",
 ]
 
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# Length of the substrings kept in the search index
+SEARCH_NGRAM = 3
+
+# Per-mirror record of the packages fetched by sync
+SYNC_MANIFEST = ".fwget-manifest.json"
+
+# Size of the blocks streamed from the network to disk during downloads
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Smallest byte range worth its own connection when a download is segmented
+DOWNLOAD_SEGMENT_MIN_SIZE = 16 * 1024 * 1024
+
+
+def split_options(args, value_options=()):
+    """
+    separate "--name [value]" options from positional arguments
+
+    Options listed in value_options take a value, either as "--name value" or
+    "--name=value", and one given without a value or with an empty one is a
+    usage error; any other option is a boolean flag.  "--help" and
+    "--version" are left in place as they are handled as positional commands.
+    """
+    positional = []
+    options = {}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith("--") and arg not in ("--help", "--version"):
+            name, has_value, value = arg[2:].partition("=")
+            if name in value_options:
+                if not has_value and i + 1 < len(args) and not args[i + 1].startswith("--"):
+                    i += 1
+                    value = args[i]
+                if not value:
+                    print(f"Error: --{name} needs a value")
+                    sys.exit(1)
+                options[name] = value
+            else:
+                options[name] = value if has_value else True
+        else:
+            positional.append(arg)
+        i += 1
+    return positional, options
+
+
+@contextlib.contextmanager
+def buffered_output():
+    """
+    buffered text stream on stdout for the plain text listings, encoded as stdout is
+    """
+    sys.stdout.flush()
+    if not hasattr(sys.stdout, "buffer"):
+        # stdout was replaced by a text-only stream
+        yield sys.stdout
+        return
+    output = io.TextIOWrapper(sys.stdout.buffer, encoding=sys.stdout.encoding, errors=sys.stdout.errors, newline="\n")
+    try:
+        yield output
+    finally:
+        output.flush()
+        output.detach()
+
+
+def ascii_text(text):
+    """
+    drop the non-ASCII characters of a free-text field such as a description
+    """
+    return text.encode("ascii", "ignore").decode()
+
+
+class Timings:
+    """
+    spans and counters of one run, reported as JSON when timings are enabled
+
+    A span records the name, start offset and duration of a phase plus any
+    attributes given to it; counters add up quantities such as bytes
+    transferred.  While enabled, the DNS lookups, TCP connects and TLS
+    handshakes made through urllib3 and the time to the response headers of
+    every request are recorded as spans too, once the network stack is loaded.  The report goes to stderr, or
+    to a file, when the process exits.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.destination = "-"
+        self.command = ""
+        self.profiler = None
+        self.profile_file = ""
+        self.started = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def configure(self, options, command):
+        """
+        enable timings from --timings[=file] or FWGET_TIMINGS, and profiling
+        from --profile <file> or FWGET_PROFILE
+        """
+        destination = options.get("timings") or os.environ.get("FWGET_TIMINGS", "")
+        if destination and destination not in ("0", "no"):
+            self.enabled = True
+            self.destination = "-" if destination in (True, "1", "yes", "-", "stderr") else destination
+            self.command = command
+        profile_file = options.get("profile") or os.environ.get("FWGET_PROFILE", "")
+        if profile_file and profile_file is not True:
+            import cProfile
+
+            self.profile_file = profile_file
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if self.enabled or self.profiler:
+            atexit.register(self.report)
+
+    def record(self, name, start, duration, attributes):
+        span = {"name": name, "start": round(start - self.started, 6), "seconds": round(duration, 6)}
+        span.update(attributes)
+        with self.lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """
+        time the enclosed block; attributes can still be added to the yielded dict
+        """
+        if not self.enabled:
+            yield attributes
+            return
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record(name, start, time.perf_counter() - start, attributes)
+
+    def count(self, name, amount):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def response_hook(self, response, *args, **kwargs):
+        """
+        requests hook recording the time from sending a request to its response headers
+        """
+        elapsed = response.elapsed.total_seconds()
+        url = urllib3.util.parse_url(response.url)
+        # Only host and path: the URL of SDR requests carries the access token
+        self.record(
+            "http", time.perf_counter() - elapsed, elapsed,
+            {"method": response.request.method, "host": url.host, "path": url.path, "status": response.status_code},
+        )
+
+    def instrument(self, session):
+        if self.enabled:
+            session.hooks["response"].append(self.response_hook)
+        return session
+
+    def instrument_connections(self, urllib3):
+        """
+        wrap name resolution, connection setup and the TLS handshake with spans
+        """
+        import socket
+
+        getaddrinfo = socket.getaddrinfo
+        new_conn = urllib3.connection.HTTPConnection._new_conn
+        https_connect = urllib3.connection.HTTPSConnection.connect
+        timings = self
+
+        def timed_getaddrinfo(host, *args, **kwargs):
+            with timings.span("dns", host=str(host)):
+                return getaddrinfo(host, *args, **kwargs)
+
+        def timed_new_conn(connection):
+            with timings.span("connect", host=connection.host, port=connection.port):
+                sock = new_conn(connection)
+            timings.local.connected = time.perf_counter()
+            return sock
+
+        def timed_https_connect(connection):
+            timings.local.connected = None
+            https_connect(connection)
+            if timings.local.connected is not None:
+                connected = timings.local.connected
+                timings.record("tls", connected, time.perf_counter() - connected, {"host": connection.host})
+
+        socket.getaddrinfo = timed_getaddrinfo
+        urllib3.connection.HTTPConnection._new_conn = timed_new_conn
+        urllib3.connection.HTTPSConnection.connect = timed_https_connect
+
+    def report(self):
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_file)
+        if not self.enabled:
+            return
+        summary = {}
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+            counters = dict(self.counters)
+        for span in spans:
+            total = summary.setdefault(span["name"], {"count": 0, "seconds": 0.0})
+            total["count"] += 1
+            total["seconds"] = round(total["seconds"] + span["seconds"], 6)
+        report = json.dumps({
+            "command": self.command,
+            "version": FWGET_VER,
+            "seconds": round(time.perf_counter() - self.started, 6),
+            "summary": summary,
+            "counters": counters,
+            "spans": spans,
+        })
+        try:
+            if self.destination == "-":
+                sys.stderr.write(report + "\n")
+            else:
+                with open(self.destination, "w", encoding="utf-8") as f:
+                    f.write(report + "\n")
+        except OSError as e:
+            print(f"Unable to write timings to {self.destination}: {e}", file=sys.stderr)
+
+
+# Timings of this run, configured from the command line by do_fwget and do_fwlist
+TIMINGS = Timings()
+
+
+class Transport:
+    """
+    HTTP client shared by fwget and fwlist
+
+    One requests session keeps a pool of keep-alive connections per host.
+    Every request gets connect and read timeouts.  Idempotent requests that
+    fail to connect, time out, or are answered 429, 502, 503 or 504 are
+    retried up to retries times.  A retry waits for the Retry-After the server
+    asked for, or an exponential backoff with full jitter, capped at
+    MAX_DELAY seconds.  When deadline (a time.monotonic() value) is set, no
+    request or retry runs past it.  The requests, retries, failures and latency of every
+    host are counted in hosts, and also as counters of the timings report.
+    """
+
+    IDEMPOTENT = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+    RETRY_STATUS = (429, 502, 503, 504)
+    MAX_DELAY = 30
+
+    def __init__(self, pool_size=1, hosts=1, timeout=(10, 30), retries=3, backoff=0.5):
+        import_requests()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max(1, hosts), pool_maxsize=max(1, pool_size))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        TIMINGS.instrument(self.session)
+        self.headers = self.session.headers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hosts = {}  # host -> {"requests", "retries", "failures", "seconds"}
+        self.lock = threading.Lock()
+        self.deadline = None
+
+    @property
+    def verify(self):
+        return self.session.verify
+
+    @verify.setter
+    def verify(self, verify):
+        self.session.verify = verify
+
+    @property
+    def trust_env(self):
+        return self.session.trust_env
+
+    @trust_env.setter
+    def trust_env(self, trust_env):
+        self.session.trust_env = trust_env
+
+    def account(self, host, counter, seconds=0.0):
+        with self.lock:
+            stats = self.hosts.setdefault(host, {"requests": 0, "retries": 0, "failures": 0, "seconds": 0.0})
+            stats[counter] += 1
+            stats["seconds"] += seconds
+        TIMINGS.count(f"http.{counter}[{host}]", 1)
+        if seconds:
+            TIMINGS.count(f"http.seconds[{host}]", round(seconds, 6))
+
+    def retry_delay(self, attempt, response=None):
+        """
+        seconds to wait before retry number attempt + 1, from Retry-After when the server gave one
+        """
+        retry_after = response.headers.get("Retry-After", "").strip() if response is not None else ""
+        if retry_after:
+            try:
+                return min(self.MAX_DELAY, max(0.0, float(retry_after)))
+            except ValueError:
+                from email.utils import parsedate_to_datetime
+
+                try:
+                    return min(self.MAX_DELAY, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        import random
+
+        return random.uniform(0, min(self.MAX_DELAY, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        """
+        send a request through the pool, retrying it as described above when it is idempotent
+        """
+        from urllib.parse import urlsplit
+
+        # Only the host name: SDR URLs carry the access token as user name
+        host = urlsplit(url).hostname or ""
+        timeout = kwargs.pop("timeout", self.timeout)
+        retries = self.retries if method.upper() in self.IDEMPOTENT else 0
+        attempt = 0
+        while True:
+            if self.deadline is not None:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    raise requests.Timeout(f"{method} {host}: deadline exceeded")
+                if isinstance(timeout, tuple):
+                    timeout = tuple(remaining if t is None else min(t, remaining) for t in timeout)
+                else:
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self.account(host, "failures", time.perf_counter() - started)
+                reason, delay = type(error).__name__, self.retry_delay(attempt)
+                if attempt >= retries or self.past_deadline(delay):
+                    raise
+            else:
+                self.account(host, "requests", time.perf_counter() - started)
+                if attempt >= retries or response.status_code not in self.RETRY_STATUS:
+                    return response
+                reason, delay = f"HTTP {response.status_code}", self.retry_delay(attempt, response)
+                if self.past_deadline(delay):
+                    return response
+                response.close()
+            attempt += 1
+            self.account(host, "retries")
+            print(f"{method} {host}: {reason}, retry {attempt} of {retries} in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+
+    def past_deadline(self, delay=0.0):
+        return self.deadline is not None and time.monotonic() + delay >= self.deadline
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+class Bandwidth:
+    """
+    process-wide cap on the download rate, shared by priority
+
+    Every transfer registers with a priority.  While a rate is set, a
+    transfer may use the share of it proportional to its priority among the
+    transfers running at that moment: a priority 4 download gets four times
+    the bandwidth of a priority 1 download running beside it, and all of it
+    once alone.  The shares are recomputed for every chunk, so they follow
+    transfers starting and finishing.  Without a rate nothing is throttled.
+    """
+
+    def __init__(self):
+        self.rate = 0  # bytes per second, 0 for no cap
+        self.lock = threading.Lock()
+        self.active = {}  # id of a transfer's state -> state
+
+    def chunk_size(self):
+        """
+        read size keeping the throttled stream smooth: about a tenth of a second at the cap
+        """
+        if not self.rate:
+            return DOWNLOAD_CHUNK_SIZE
+        return int(min(DOWNLOAD_CHUNK_SIZE, max(16 * 1024, self.rate / 10)))
+
+    @contextlib.contextmanager
+    def transfer(self, priority=1.0):
+        """
+        register a transfer for the enclosed block; yields the function to call with each chunk size received
+        """
+        state = {"priority": max(float(priority), 0.001), "due": time.monotonic()}
+        with self.lock:
+            self.active[id(state)] = state
+        try:
+            yield lambda amount: self.consume(state, amount)
+        finally:
+            with self.lock:
+                del self.active[id(state)]
+
+    def consume(self, state, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            share = self.rate * state["priority"] / sum(other["priority"] for other in self.active.values())
+            now = time.monotonic()
+            # Time not used while the transfer waited on the network is not saved up for later
+            state["due"] = max(state["due"], now) + amount / share
+            delay = state["due"] - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Download rate cap of this process, set by fwget from --limit-rate or download_rate_limit
+BANDWIDTH = Bandwidth()
+
+
+class FWSearchIndex:
+    """
+    trigram inverted index over filename, description, target and deviceclass
+
+    Every lowercased trigram of an entry's fields maps to the ordinals of the
+    entries containing it, so a substring query only has to intersect the
+    postings of its own trigrams and verify the few candidates left.  Target
+    IDs are additionally kept as exact keys, matching how search compares them.
+
+    Like FWBinaryIndex, the file is memory-mapped and read in place: a
+    header, the filenames as (offset, length) records into a UTF-8 string
+    pool, then a table of trigrams and a table of target IDs, each sorted
+    by key and pointing to its ordinals in one array of postings.  Opening
+    it reads the header only; a query binary-searches its keys and decodes
+    their postings alone.
+    """
+
+    MAGIC = b"FWGS"
+    FORMAT = 2
+    HEADER = struct.Struct("<4sHIIIIH")  # magic, format, names, trigrams, targets, postings, stamp length
+    SPAN = struct.Struct("<II")  # offset and length of a string in the pool
+    KEY = struct.Struct("<IIII")  # key offset and length in the pool, first posting and number of postings
+
+    def __init__(self, buffer, names_at, names, grams, targets, postings):
+        self.buffer = buffer
+        self.names_at = names_at
+        self.grams_at = names_at + names * self.SPAN.size
+        self.grams = grams
+        self.targets_at = self.grams_at + grams * self.KEY.size
+        self.targets = targets
+        self.postings_at = self.targets_at + targets * self.KEY.size
+        self.pool_at = self.postings_at + postings * 4
+
+    def close(self):
+        self.buffer.close()
+
+    @classmethod
+    def write(cls, filename, json_index, stamp):
+        names = list(json_index)
+        grams = {}
+        targets = {}
+        for ordinal, fw in enumerate(names):
+            entry = json_index[fw]
+            fields = [fw, entry["description"], entry["deviceclass"]]
+            if isinstance(entry["target"], str):
+                fields.append(entry["target"])
+            else:
+                for target in entry["target"]:
+                    targets.setdefault(target, []).append(ordinal)
+            text = "\n".join(fields).lower()
+            for gram in {text[i:i + SEARCH_NGRAM] for i in range(len(text) - SEARCH_NGRAM + 1)}:
+                grams.setdefault(gram, []).append(ordinal)
+
+        pool = bytearray()
+        postings = array("I")
+
+        def span(text):
+            data = text.encode("utf-8")
+            pool.extend(data)
+            return len(pool) - len(data), len(data)
+
+        def table(keys):
+            records = []
+            for key in sorted(keys, key=lambda key: key.encode("utf-8")):
+                records.append(cls.KEY.pack(*span(key), len(postings), len(keys[key])))
+                postings.extend(keys[key])
+            return b"".join(records)
+
+        name_records = b"".join(cls.SPAN.pack(*span(fw)) for fw in names)
+        gram_records, target_records = table(grams), table(targets)
+        if sys.byteorder == "big":
+            postings.byteswap()
+        stamp = stamp.encode("utf-8")
+        try:
+            with atomic_file(filename, "wb") as index_file:
+                index_file.write(
+                    cls.HEADER.pack(cls.MAGIC, cls.FORMAT, len(names), len(grams), len(targets), len(postings), len(stamp))
+                )
+                index_file.write(stamp)
+                index_file.write(name_records)
+                index_file.write(gram_records)
+                index_file.write(target_records)
+                index_file.write(postings.tobytes())
+                index_file.write(pool)
+        except OSError as e:
+            print(f"Unable to write search index {filename}. Error: {e}", file=sys.stderr)
+
+    @classmethod
+    def open(cls, filename, stamp):
+        """
+        map a persisted index, or return None if it is missing or was built from another index
+        """
+        try:
+            with open(filename, "rb") as index_file:
+                buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, fmt, names, grams, targets, postings, stamp_len = cls.HEADER.unpack_from(buffer, 0)
+            file_stamp = buffer[cls.HEADER.size:cls.HEADER.size + stamp_len].decode("utf-8")
+        except (struct.error, UnicodeDecodeError):
+            buffer.close()
+            return None
+        if (magic, fmt, file_stamp) != (cls.MAGIC, cls.FORMAT, stamp):
+            buffer.close()
+            return None
+        return cls(buffer, cls.HEADER.size + stamp_len, names, grams, targets, postings)
+
+    def name(self, ordinal):
+        offset, length = self.SPAN.unpack_from(self.buffer, self.names_at + ordinal * self.SPAN.size)
+        start = self.pool_at + offset
+        return self.buffer[start:start + length].decode("utf-8")
+
+    def postings(self, table_at, count, key):
+        """
+        return the ordinals of key in the table at table_at, by binary search over its sorted keys
+        """
+        key = key.encode("utf-8")
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, first, length = self.KEY.unpack_from(self.buffer, table_at + middle * self.KEY.size)
+            current = self.buffer[self.pool_at + key_offset:self.pool_at + key_offset + key_length]
+            if current == key:
+                return struct.unpack_from(f"<{length}I", self.buffer, self.postings_at + 4 * first)
+            if current < key:
+                low = middle + 1
+            else:
+                high = middle
+        return ()
+
+    def candidates(self, searchstring):
+        """
+        return the names that may contain searchstring, or None when the
+        string is shorter than a trigram and every entry has to be scanned
+        """
+        key = searchstring.lower()
+        if len(key) < SEARCH_NGRAM:
+            return None
+        postings = sorted(
+            (self.postings(self.grams_at, self.grams, key[i:i + SEARCH_NGRAM]) for i in range(len(key) - SEARCH_NGRAM + 1)),
+            key=len,
+        )
+        ordinals = set(postings[0])
+        for posting in postings[1:]:
+            if not ordinals:
+                break
+            ordinals.intersection_update(posting)
+        ordinals.update(self.postings(self.targets_at, self.targets, key))
+        # Keep the index order so results tied on date come out as a full scan would
+        return [self.name(ordinal) for ordinal in sorted(ordinals)]
+
+
+class FWBinaryIndex(Mapping):
+    """
+    read-only, memory-mapped view of the firmware index
+
+    The file holds a header, one fixed-size record of (offset, length) pairs
+    per firmware pointing into a UTF-8 string pool, and the record ordinals
+    sorted by filename.  Nothing is decoded up front: a field is decoded when
+    it is read, and a filename lookup is a binary search over the ordinals.
+
+    FIELDS names the slots of a record, not index keys: the filename, the
+    string values of the common keys (target as JSON), and every other key
+    of the entry as one JSON object.  A common key an entry lacks, or holds
+    something else than a string, has an ABSENT slot and is kept with the
+    other keys, so any entry reads back as it was written.
+    """
+
+    MAGIC = b"FWGB"
+    FORMAT = 2
+    FIELDS = ("<filename>", "date", "description", "target", "deviceclass", "<other keys>")
+    COMMON = ("date", "description", "target", "deviceclass")
+    ABSENT = 0xFFFFFFFF  # length of a slot without value
+    HEADER = struct.Struct("<4sHHIH")
+    RECORD = struct.Struct("<" + "II" * len(FIELDS))
+    FIELD = struct.Struct("<II")
+    ORDINAL = struct.Struct("<I")
+
+    def __init__(self, buffer, count, records_at):
+        self.buffer = buffer
+        self.count = count
+        self.records_at = records_at
+        self.sorted_at = records_at + count * self.RECORD.size
+        self.pool_at = self.sorted_at + count * self.ORDINAL.size
+
+    def close(self):
+        self.buffer.close()
+
+    @classmethod
+    def write(cls, filename, json_index, stamp):
+        names = list(json_index)
+        pool = bytearray()
+        records = []
+        for name in names:
+            entry = json_index[name]
+            values = [name]
+            for key in cls.COMMON:
+                if key == "target" and key in entry:
+                    values.append(json.dumps(entry[key]))
+                else:
+                    values.append(entry[key] if isinstance(entry.get(key), str) else None)
+            other = {
+                key: value for key, value in entry.items() if key not in cls.COMMON or values[cls.FIELDS.index(key)] is None
+            }
+            values.append(json.dumps(other) if other else "")
+            record = []
+            for value in values:
+                if value is None:
+                    record += (0, cls.ABSENT)
+                    continue
+                data = value.encode("utf-8")
+                record += (len(pool), len(data))
+                pool += data
+            records.append(cls.RECORD.pack(*record))
+        order = sorted(range(len(names)), key=names.__getitem__)
+
+        stamp = stamp.encode("utf-8")
+        try:
+            with atomic_file(filename, "wb") as index_file:
+                index_file.write(cls.HEADER.pack(cls.MAGIC, cls.FORMAT, len(cls.FIELDS), len(names), len(stamp)))
+                index_file.write(stamp)
+                index_file.write(b"".join(records))
+                index_file.write(b"".join(cls.ORDINAL.pack(ordinal) for ordinal in order))
+                index_file.write(pool)
+        except OSError as e:
+            print(f"Unable to write binary index {filename}. Error: {e}", file=sys.stderr)
+
+    @classmethod
+    def open(cls, filename, stamp):
+        """
+        map a binary index, or return None if it is missing or was built from another index
+        """
+        try:
+            with open(filename, "rb") as index_file:
+                buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, fmt, nfields, count, stamp_len = cls.HEADER.unpack_from(buffer, 0)
+            records_at = cls.HEADER.size + stamp_len
+            file_stamp = buffer[cls.HEADER.size:records_at].decode("utf-8")
+        except (struct.error, UnicodeDecodeError):
+            buffer.close()
+            return None
+        if (magic, fmt, nfields, file_stamp) != (cls.MAGIC, cls.FORMAT, len(cls.FIELDS), stamp):
+            buffer.close()
+            return None
+        return cls(buffer, count, records_at)
+
+    def field(self, ordinal, field):
+        """
+        decode one field of a firmware, or return None when its slot is ABSENT
+        """
+        offset, length = self.FIELD.unpack_from(
+            self.buffer, self.records_at + ordinal * self.RECORD.size + field * self.FIELD.size
+        )
+        if length == self.ABSENT:
+            return None
+        start = self.pool_at + offset
+        return self.buffer[start:start + length].decode("utf-8")
+
+    def column(self, field, absent=""):
+        """
+        decode one field of every firmware, in ordinal order, in a single pass
+        over the records; ABSENT slots read as absent
+        """
+        buffer, pool_at = self.buffer, self.pool_at
+        offset, length = 2 * field, 2 * field + 1
+        return [
+            buffer[pool_at + record[offset]:pool_at + record[offset] + record[length]].decode("utf-8")
+            if record[length] != self.ABSENT
+            else absent
+            for record in self.RECORD.iter_unpack(buffer[self.records_at:self.sorted_at])
+        ]
+
+    def ordinal(self, name):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            (ordinal,) = self.ORDINAL.unpack_from(self.buffer, self.sorted_at + middle * self.ORDINAL.size)
+            current = self.field(ordinal, 0)
+            if current == name:
+                return ordinal
+            if current < name:
+                low = middle + 1
+            else:
+                high = middle
+        raise KeyError(name)
+
+    def __getitem__(self, name):
+        return FWBinaryEntry(self, self.ordinal(name))
+
+    def __iter__(self):
+        for ordinal in range(self.count):
+            yield self.field(ordinal, 0)
+
+    def __len__(self):
+        return self.count
+
+
+class FWBinaryEntry(Mapping):
+    """
+    one firmware of a FWBinaryIndex, decoding its fields on first access
+    """
+
+    def __init__(self, index, ordinal):
+        self.index = index
+        self.ordinal = ordinal
+        self.values = {}  # common keys decoded so far
+        self.others = None  # every other key, decoded on first use
+
+    def other_keys(self):
+        if self.others is None:
+            others = self.index.field(self.ordinal, len(FWBinaryIndex.FIELDS) - 1)
+            self.others = json.loads(others) if others else {}
+        return self.others
+
+    def __getitem__(self, key):
+        if key in self.values:
+            return self.values[key]
+        if key in FWBinaryIndex.COMMON:
+            value = self.index.field(self.ordinal, FWBinaryIndex.FIELDS.index(key))
+            if value is not None:
+                self.values[key] = json.loads(value) if key == "target" else value
+                return self.values[key]
+        return self.other_keys()[key]
+
+    def __contains__(self, key):
+        if key in FWBinaryIndex.COMMON and key not in self.values:
+            if self.index.field(self.ordinal, FWBinaryIndex.FIELDS.index(key)) is not None:
+                return True
+        return key in self.values or key in self.other_keys()
+
+    def __iter__(self):
+        for key in FWBinaryIndex.COMMON:
+            if self.index.field(self.ordinal, FWBinaryIndex.FIELDS.index(key)) is not None:
+                yield key
+        yield from self.other_keys()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class FWColumns:
+    """
+    column-oriented copy of the firmware index
+
+    Every field is a list, parallel to names, of the lowercased values of all
+    entries; dates are normalized by firmware_date so they compare as
+    strings, and "targets" maps each lowercased target ID to its ordinals.
+    A column is only built the first time a query uses it.
+    """
+
+    FIELDS = ("file", "description", "target", "deviceclass", "date")
+
+    def __init__(self, json_index):
+        self.json_index = json_index
+        self.binary = isinstance(json_index, FWBinaryIndex)
+        self.names = json_index.column(0) if self.binary else list(json_index)
+        self.columns = {}
+
+    def column(self, field):
+        if field not in self.columns:
+            with TIMINGS.span("index.build", format="column", field=field):
+                self.columns[field] = self.build(field)
+        return self.columns[field]
+
+    def build(self, field):
+        if field == "file":
+            return [fw.lower() for fw in self.names]
+        if field == "targets":
+            targets = {}
+            for ordinal, text in enumerate(self.column("target")):
+                for target in text.split("\n"):
+                    targets.setdefault(target, []).append(ordinal)
+            return targets
+        if self.binary:
+            values = self.json_index.column(FWBinaryIndex.FIELDS.index(field), "[]" if field == "target" else "")
+            if field == "target":
+                # One JSON document for the whole column instead of one per firmware
+                values = json.loads("[" + ",".join(values) + "]")
+        else:
+            values = [self.json_index[fw][field] for fw in self.names]
+        if field == "date":
+            # Most index dates are already YYYY-MM-DD and need no parsing
+            return [
+                value if len(value) == 10 and value[4] == value[7] == "-" else firmware_date(value) or ""
+                for value in values
+            ]
+        if field == "target":
+            # One string per entry, a target ID per line
+            return ["\n".join([value] if isinstance(value, str) else value).lower() for value in values]
+        return [value.lower() for value in values]
+
+
+class FWQuery:
+    """
+    structured query over the firmware index
+
+    Terms are combined with and, or, not and parentheses; terms written next
+    to each other are and-ed.  A term is one of
+      text                  text in the filename, description or device class, or a target ID, as search
+      field:text            text in one field
+      field=text            the whole field, or one of the target IDs
+      field~regex           a regular expression found in one field
+      date>=D, date<D, ...  dates compared with D (also >, <=, =)
+      date:D1..D2           dates from D1 to D2 included, either end may be left out
+    with field one of file, description, target, deviceclass and date.
+    Text containing spaces or parentheses is written in double quotes.
+    Matching ignores case.
+
+    The query is parsed once into a tree of functions.  A term is evaluated in
+    a single pass over one column of FWColumns, giving the set of matching
+    ordinals, and and, or and not are set operations over those sets.
+    """
+
+    TOKEN = re.compile(
+        r'\s*(?:(?P<paren>[()])|(?:(?P<field>[a-z]+)(?P<op>>=|<=|[:=~<>]))?(?P<value>"(?:[^"\\]|\\.)*"|[^\s()"]+))',
+        re.IGNORECASE,
+    )
+    COMPARE = {
+        "<": lambda value, limit: value < limit,
+        "<=": lambda value, limit: value <= limit,
+        ">": lambda value, limit: value > limit,
+        ">=": lambda value, limit: value >= limit,
+        "=": lambda value, limit: value == limit,
+    }
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = self.tokenize(text)
+        self.position = 0
+        if not self.tokens:
+            raise ValueError("empty query")
+        self.evaluate = self.parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError(f"unexpected {self.describe(self.tokens[self.position])}")
+
+    def tokenize(self, text):
+        tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = self.TOKEN.match(text, position)
+            if not match:
+                raise ValueError(f"cannot parse {text[position:].strip()!r}")
+            position = match.end()
+            if match.group("paren"):
+                tokens.append(("paren", match.group("paren")))
+                continue
+            value = match.group("value")
+            quoted = value.startswith('"')
+            if quoted:
+                # Only \" is an escape, so regular expressions keep their backslashes
+                value = value[1:-1].replace('\\"', '"')
+            field = (match.group("field") or "").lower()
+            if field:
+                if field not in FWColumns.FIELDS:
+                    raise ValueError(f"unknown field {field!r}, use one of {', '.join(FWColumns.FIELDS)}")
+                tokens.append(("term", (field, match.group("op"), value)))
+            elif not quoted and value.lower() in ("and", "or", "not"):
+                tokens.append(("operator", value.lower()))
+            else:
+                tokens.append(("term", ("", ":", value)))
+        return tokens
+
+    def describe(self, token):
+        kind, value = token
+        return f"term {''.join(value)!r}" if kind == "term" else repr(value)
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.peek() == ("operator", "or"):
+            self.position += 1
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda columns: set().union(*(operand(columns) for operand in operands))
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while True:
+            token = self.peek()
+            if token == ("operator", "and"):
+                self.position += 1
+            elif token[0] != "term" and token not in (("operator", "not"), ("paren", "(")):
+                break
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+
+        def conjunction(columns):
+            result = operands[0](columns)
+            for operand in operands[1:]:
+                if not result:
+                    break
+                result &= operand(columns)
+            return result
+        return conjunction
+
+    def parse_not(self):
+        kind, value = self.peek()
+        if kind is None:
+            raise ValueError("query ends early")
+        self.position += 1
+        if (kind, value) == ("operator", "not"):
+            operand = self.parse_not()
+            return lambda columns: set(range(len(columns.names))) - operand(columns)
+        if (kind, value) == ("paren", "("):
+            operand = self.parse_or()
+            if self.peek() != ("paren", ")"):
+                raise ValueError("missing )")
+            self.position += 1
+            return operand
+        if kind != "term":
+            raise ValueError(f"unexpected {self.describe((kind, value))}")
+        return self.term(*value)
+
+    def term(self, field, op, value):
+        """
+        compile one term into a function of FWColumns returning the set of matching ordinals
+        """
+        needle = value.lower()
+        if not field:
+            def anywhere(columns):
+                result = set()
+                for name in ("file", "description", "deviceclass"):
+                    result.update(i for i, text in enumerate(columns.column(name)) if needle in text)
+                result.update(columns.column("targets").get(needle, ()))
+                return result
+            return anywhere
+
+        if field == "date" and op != "~":
+            if op == ":" and ".." in value:
+                low, _, high = value.partition("..")
+                low, high = self.date(low) if low else "", self.date(high) if high else ""
+                return lambda columns: {
+                    i for i, date in enumerate(columns.column("date"))
+                    if date and date >= low and (not high or date <= high)
+                }
+            if op in self.COMPARE:
+                limit, compare = self.date(value), self.COMPARE[op]
+                return lambda columns: {i for i, date in enumerate(columns.column("date")) if date and compare(date, limit)}
+        elif op in ("<", "<=", ">", ">="):
+            raise ValueError(f"{op} only compares dates, not {field}")
+
+        if op == "~":
+            try:
+                pattern = re.compile(value, re.IGNORECASE | re.MULTILINE)
+            except re.error as error:
+                raise ValueError(f"invalid regular expression {value!r}: {error}") from None
+            return lambda columns: {i for i, text in enumerate(columns.column(field)) if pattern.search(text)}
+        if op == "=" and field == "target":
+            return lambda columns: set(columns.column("targets").get(needle, ()))
+        if op == "=":
+            return lambda columns: {i for i, text in enumerate(columns.column(field)) if text == needle}
+        return lambda columns: {i for i, text in enumerate(columns.column(field)) if needle in text}
+
+    def date(self, text):
+        date = firmware_date(text)
+        if date is None:
+            raise ValueError(f"{text!r} is not a date (YYYY-MM-DD)")
+        return date
+
+    def names(self, columns):
+        """
+        return the names of the entries matching the query, in index order
+        """
+        return [columns.names[ordinal] for ordinal in sorted(self.evaluate(columns))]
+
+
+def version_tuple(text):
+    """
+    return the first dotted version number of text as a tuple of ints, e.g. "A55 v2.10" -> (2, 10)
+    """
+    match = re.search(r"\d+(?:\.\d+)+", str(text))
+    return tuple(int(part) for part in match.group(0).split(".")) if match else None
+
+
+def byte_rate(text):
+    """
+    return a rate such as "500K", "10M" or "1.5G" (powers of 1024, per second) in bytes per second
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"\"{text}\" is not a rate such as 500K or 10M")
+    return float(match.group(1)) * 1024 ** " KMG".index(match.group(2).upper() or " ")
+
+
+def firmware_date(text):
+    """
+    return the date found in a firmware version or index date as "YYYY-MM-DD", or None
+
+    Handles "2024-07-31", "07/31/2024" and "Jul 31 2024", the forms used by
+    fwrepo.json and by iLO FirmwareInventory versions.
+    """
+    text = str(text)
+    match = re.search(r"(\d{4})-(\d{1,2})-(\d{1,2})", text)
+    if match:
+        year, month, day = match.groups()
+        return f"{year}-{int(month):02d}-{int(day):02d}"
+    match = re.search(r"(\d{1,2})/(\d{1,2})/(\d{4})", text)
+    if match:
+        month, day, year = match.groups()
+        return f"{year}-{int(month):02d}-{int(day):02d}"
+    match = re.search(r"\b([A-Z][a-z]{2})\w* (\d{1,2}),? (\d{4})", text)
+    if match and match.group(1) in MONTHS:
+        month, day, year = MONTHS.index(match.group(1)) + 1, int(match.group(2)), match.group(3)
+        return f"{year}-{month:02d}-{day:02d}"
+    return None
+
+
+def tmp_name(path):
+    """
+    name of a temporary file next to path, private to this process and thread
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+@contextlib.contextmanager
+def atomic_file(path, mode="w", opener=None):
+    """
+    open a private temporary file that replaces path once it is completely
+    written, or is removed if writing fails, so that concurrent writers
+    never mix their data into one file
+    """
+    tmp_path = tmp_name(path)
+    try:
+        with open(tmp_path, mode, encoding=None if "b" in mode else "utf-8", opener=opener) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def file_digest(path):
+    """
+    return (path, size, sha256) of a file, or (path, None, error) if it cannot be read
+
+    Kept at module level so verify can run it in worker processes.
+    """
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        return path, os.path.getsize(path), sha256.hexdigest()
+    except OSError as e:
+        return path, None, str(e)
+
+
+def plain_file_name(name):
+    """
+    tell whether name, taken from a remote index, is a bare file name that stays in the directory it is joined to
+    """
+    return isinstance(name, str) and name not in ("", ".", "..") and "/" not in name and os.path.basename(name) == name
+
+
+class FWListExport:
+    """
+    streaming writer of the fwlist inventory
+
+    Each record is rendered once, as soon as it is parsed, and the text is
+    written to stdout and to the output file together.  The file is written
+    under a temporary name and only replaces <path> on close(), so an interrupted run
+    keeps the previous export.  With path "-" the inventory goes to stdout only.
+    """
+
+    FORMATS = ("spaced_display", "json_display", "ndjson", "csv")
+    CSV_COLUMNS = ("@odata.id", "Name", "Version", "Description", "targets")
+
+    def __init__(self, path, output_format="spaced_display"):
+        if output_format not in FWListExport.FORMATS:
+            raise ValueError(f"Supported display:{FWListExport.FORMATS}, Selected display:{output_format}")
+        self.format = output_format
+        self.path = None if path == "-" else path
+        self.tmp_path = tmp_name(self.path) if self.path else None
+        self.file = open(self.tmp_path, "w", encoding="utf-8") if self.path else None
+        self.count = 0
+        self.done = False
+        if output_format == "csv":
+            self.emit(self.csv_row(FWListExport.CSV_COLUMNS))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def emit(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        if self.file:
+            self.file.write(text)
+
+    def csv_row(self, values):
+        import csv
+
+        row = io.StringIO()
+        csv.writer(row, lineterminator="\n").writerow(values)
+        return row.getvalue()
+
+    def write(self, odata):
+        """
+        export one FirmwareInventory record
+        """
+        if self.format == "spaced_display":
+            text = "".join(
+                f"\n{attribute}:{' '.join(value) if isinstance(value, list) else value}" for attribute, value in odata.items()
+            ) + "\n"
+        elif self.format == "json_display":
+            # The same text json.dump(odata_list, indent=4, sort_keys=True) writes, one member at a time
+            member = json.dumps(odata, indent=4, sort_keys=True).replace("\n", "\n    ")
+            text = ("[\n    " if not self.count else ",\n    ") + member
+        elif self.format == "ndjson":
+            text = json.dumps(odata) + "\n"
+        else:
+            text = self.csv_row(
+                [" ".join(odata.get(column) or []) if column == "targets" else odata.get(column, "")
+                 for column in FWListExport.CSV_COLUMNS]
+            )
+        self.count += 1
+        self.emit(text)
+
+    def close(self):
+        """
+        finish the export and move it into place
+        """
+        if self.done:
+            return
+        self.done = True
+        if self.format == "json_display":
+            self.emit("\n]" if self.count else "[]")
+        if self.format in ("spaced_display", "json_display"):
+            sys.stdout.write("\n")
+        if not self.file:
+            return
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        # The display formats are read by people; keep stdout clean for the machine readable ones
+        notice = sys.stdout if self.format in ("spaced_display", "json_display") else sys.stderr
+        print("\nexport result to ", self.path, file=notice)
+
+    def discard(self):
+        if self.done:
+            return
+        self.done = True
+        if not self.file:
+            return
+        self.file.close()
+        with contextlib.suppress(OSError):
+            os.remove(self.tmp_path)
+
+
 ###########
 # parse     command line, setup config file if it doens't exist, prompt for token
 class Configuration:
@@ -74,21 +1281,75 @@ class Configuration:
         self.ilo_proxy = ""
         self.token = ""
         self.sdr_url = ""
+        self.sdr_urls = []
+        self.sdr_allow_http = "no"
+        self.index_max_age = 0
+        self.download_workers = 4
+        self.download_segments = 1
+        self.download_rate_limit = 0
+        self.redfish_workers = 8
+        self.session_cache = "no"
+        self.session_idle_timeout = 600
+        self.inventory_cache = "yes"
+        self.package_cache = os.path.join(os.path.expanduser("~"), ".cache", "fwget")
+        self.package_cache_max_size = 10240
+        self.http_connect_timeout = 10
+        self.http_read_timeout = 30
+        self.http_retries = 3
+        self.http_backoff = 0.5
         self.default_sdr_url = "https://downloads.linux.hpe.com/SDR/repo/fwpp-gen11/current"
+        self.machine_output = False  # stdout carries JSON only, notices go to stderr
+
+    def http_config_parser(self, json_config):
+        """
+        read the Transport settings shared by fwget and fwlist
+        """
+        # Seconds to establish a connection, and to wait for each read of a response
+        self.http_connect_timeout = float(json_config.get("http_connect_timeout", 10))
+        self.http_read_timeout = float(json_config.get("http_read_timeout", 30))
+        # Retries of a failed idempotent request, the first after about http_backoff seconds
+        self.http_retries = max(0, int(json_config.get("http_retries", 3)))
+        self.http_backoff = max(0.0, float(json_config.get("http_backoff", 0.5)))
+
+    def transport(self, pool_size, hosts=1, timeout=None):
+        return Transport(
+            pool_size=pool_size,
+            hosts=hosts,
+            timeout=timeout or (self.http_connect_timeout, self.http_read_timeout),
+            retries=self.http_retries,
+            backoff=self.http_backoff,
+        )
 
     def fwget_config_parser(self):
         try:
             with open(self.config_file, "r", encoding="utf-8") as json_config_file:
                 json_config = json.load(json_config_file)
-                self.sdr_url = json_config["sdr_url"]
+                # sdr_url is one repository URL or a list of them, searched together
+                sdr_url = json_config["sdr_url"]
+                self.sdr_urls = sdr_url if isinstance(sdr_url, list) else [sdr_url]
+                self.sdr_url = self.sdr_urls[0] if self.sdr_urls else ""
                 self.token = json_config["token"]
+                # "yes" to reach http:// sdr_urls, such as a LAN cache-serve, without TLS; the token is then sent in clear
+                self.sdr_allow_http = json_config.get("sdr_allow_http", "no")
+                # Seconds a cached index is trusted without revalidating it
+                self.index_max_age = int(json_config.get("index_max_age", 0))
+                # Number of files fetched concurrently by download
+                self.download_workers = max(1, int(json_config.get("download_workers", 4)))
+                # Byte ranges fetched concurrently for each large file, and the cap on the total rate
+                self.download_segments = max(1, int(json_config.get("download_segments", 1)))
+                self.download_rate_limit = byte_rate(json_config.get("download_rate_limit", 0))
+                # Shared content-addressed package cache, "no" to disable, and its size cap in MB
+                self.package_cache = os.path.expanduser(json_config.get("package_cache", self.package_cache))
+                self.package_cache_max_size = float(json_config.get("package_cache_max_size", 10240))
+                self.http_config_parser(json_config)
 
                 # Check if the sdr_url is a valid URL
-                if not re.match(r'^https?://', self.sdr_url):
-                    print(f"Error: \"{self.sdr_url}\" is not a valid URL")
-                    sys.exit(1)
+                for sdr_url in self.sdr_urls or [""]:
+                    if not isinstance(sdr_url, str) or not re.match(r'^https?://', sdr_url):
+                        print(f"Error: \"{sdr_url}\" is not a valid URL")
+                        sys.exit(1)
 
-        except KeyError:
+        except (KeyError, ValueError):
             print("Unable to parse " + self.config_file)
             print(f"Please check if the file {self.config_file} exists and content is correct!")
             sys.exit(1)
@@ -101,6 +1362,14 @@ class Configuration:
                 self.password = json_config["ilo_password"]
                 self.ilo_address = json_config["ilo_address"]
                 self.ilo_proxy = json_config.get("ilo_proxy")
+                # Number of FirmwareInventory members fetched concurrently
+                self.redfish_workers = max(1, int(json_config.get("redfish_workers", 8)))
+                # Keep the Redfish session between runs when set to yes
+                self.session_cache = json_config.get("session_cache", "no")
+                self.session_idle_timeout = float(json_config.get("session_idle_timeout", 600))
+                # Refresh the inventory incrementally, from the ETags of the previous run
+                self.inventory_cache = json_config.get("inventory_cache", "yes")
+                self.http_config_parser(json_config)
 
                 # Ensure ilo username and password is not empty
                 if not self.username or self.username.strip().lower() == "na":
@@ -116,14 +1385,17 @@ class Configuration:
                 except ValueError:
                     print(f"Error: \"{self.ilo_address}\" is not a valid IP Address")
                     sys.exit(1)
-        except KeyError:
+        except (KeyError, ValueError):
             print("Unable to parse " + self.config_file)
             print(f"Please check if the file {self.config_file} exists and content is correct!")
             sys.exit(1)
 
     def config_handler(self, command):
         if os.path.isfile(self.config_file):
-            print(f"Fetching firmware information with config: {self.config_file}\n")
+            print(
+                f"Fetching firmware information with config: {self.config_file}\n",
+                file=sys.stderr if self.machine_output else sys.stdout,
+            )
             if command == FWGET:
                 self.fwget_config_parser()
             elif command == FWLIST:
@@ -141,13 +1413,17 @@ class Configuration:
                     '"_comment": "sdr_url: Replace fwpp-gen11 with fwpp-gen10/fwpp-gen9/fwpp-gen8 as appropriate.",\n'
                 )
                 config_file_handle.write(
-                    '"_comment": "ilo_proxy: Set \'ilo_proxy\' to \'yes\' if you want to use environment proxy settings; default is \'no\'.",\n\n'
+                    '"_comment": "ilo_proxy: Set \'ilo_proxy\' to \'yes\' if you want to use environment proxy settings; default is \'no\'.",\n'
+                )
+                config_file_handle.write(
+                    '"_comment": "index_max_age: Seconds to reuse the cached firmware index before checking the repository again; default is 0.",\n\n'
                 )
                 config_file_handle.write('   "ilo_username": "na",\n')
                 config_file_handle.write('   "ilo_password": "na",\n')
                 config_file_handle.write('   "ilo_address": "na",\n')
                 config_file_handle.write('   "ilo_proxy": "no",\n')
                 config_file_handle.write('   "token": "na",\n')
+                config_file_handle.write('   "index_max_age": 0,\n')
                 config_file_handle.write(f'   "sdr_url": "{self.default_sdr_url}"\n\n')
                 config_file_handle.write("} \n")
                 config_file_handle.close()
@@ -162,37 +1438,207 @@ class Configuration:
 
 
 class FWGet(Configuration):
+    # Number of index deltas kept in ~/.fwget.history
+    HISTORY_LENGTH = 200
+
     def __init__(self, args):
         super().__init__()
-        self.fwget_operation = "" if len(args) < 2 else args[1]
-        self.fwget_keyword = "" if len(args) < 3 else args[2]
+        self.fwget_args, self.fwget_options = split_options(
+            args,
+            (
+                "file", "search", "workers", "deviceclass", "target", "since", "until", "link-dest",
+                "profile", "listen", "refresh", "limit", "offset", "sort", "segments", "limit-rate", "priority",
+                "cache-dir", "max-size",
+            ),
+        )
+        self.fwget_operation = "" if len(self.fwget_args) < 2 else self.fwget_args[1]
+        self.fwget_keyword = "" if len(self.fwget_args) < 3 else self.fwget_args[2]
+        self.offline = bool(self.fwget_options.get("offline"))
+        self.machine_output = bool(
+            self.fwget_options.get("ndjson")
+            or self.fwget_options.get("json")
+            or (self.fwget_operation in ("search", "locate") and self.fwget_options.get("file"))
+            # The servers keep stdout for nothing; their diagnostics all go to stderr
+            or self.fwget_operation in ("serve", "cache-serve")
+        )
         self.fwget_json_index = ""
         self.fwget_json = ".fwget.json"  # where to store sdr fw data in json format
+        self.fwget_json_meta = ".fwget.meta"  # ETag/Last-Modified of the cached index, per sdr_url
+        self.fwget_search_index = ".fwget.idx"  # trigram search index of the cached index
+        self.fwget_binary_index = ".fwget.bin"  # memory-mappable copy of the cached index
+        self.fwget_repo_dir = ".fwget.repos"  # per-repository indexes when sdr_url lists several
+        self.fwget_history = ".fwget.history"  # what each refresh of ~/.fwget.json changed, one JSON per line
+        self.repos = {}  # sdr_url -> (index_url, content_url)
+        self.search_postings = None
+        self.query_columns = None  # FWColumns of the index, built by the first query
+        self.progress_reported = 0
+        self.progress_quiet = False
+        self.progress_lock = threading.Lock()
+        self.session = None
+        self.download_priority = 1.0  # share of the download rate cap, see Bandwidth
+        self.download_priorities = {}  # file -> priority given in the --file list
         self.content_url = ""
         self.fwget_json_index = ""
+        self.serving = None  # generation of the index answering serve requests
+        self.serving_stamp = ""  # index_stamp() of that generation when it was loaded
+        self.serving_lock = threading.Lock()
+        self.serving_users = 0  # requests using this generation
+        self.serving_retired = False  # replaced by a newer generation, closed once unused
+        self.serving_started = self.serving_refreshed = 0
 
     def parse_config(self):
-        Configuration.config_handler(self, FWGET)
-        baseurl = self.sdr_url.replace("https://", "")
-        baseurl = baseurl.replace("http://", "")
-        self.index_url = (
-            "https://" + self.token + ":null@" + baseurl + "/fwrepodata/fwrepo.json"
-        )
-        self.content_url = "https://" + self.token + ":null@" + baseurl
+        with TIMINGS.span("config"):
+            Configuration.config_handler(self, FWGET)
+        if self.fwget_options.get("workers"):
+            try:
+                self.download_workers = max(1, int(self.fwget_options["workers"]))
+            except ValueError:
+                print(f"Error: \"{self.fwget_options['workers']}\" is not a valid number of workers")
+                sys.exit(1)
+        try:
+            if self.fwget_options.get("segments"):
+                self.download_segments = max(1, int(self.fwget_options["segments"]))
+            if self.fwget_options.get("limit-rate"):
+                self.download_rate_limit = byte_rate(self.fwget_options["limit-rate"])
+            if self.fwget_options.get("priority"):
+                self.download_priority = max(0.001, float(self.fwget_options["priority"]))
+        except ValueError as e:
+            print(f"Error: invalid download setting: {e}")
+            sys.exit(1)
+        BANDWIDTH.rate = self.download_rate_limit
+        for sdr_url in self.sdr_urls:
+            # https unless plain http was explicitly allowed: the access token is part of the URL
+            plain = sdr_url.startswith("http://") and str(self.sdr_allow_http).lower() == "yes"
+            scheme = "http://" if plain else "https://"
+            baseurl = sdr_url.replace("https://", "").replace("http://", "")
+            self.repos[sdr_url] = (
+                scheme + self.token + ":null@" + baseurl + "/fwrepodata/fwrepo.json",
+                scheme + self.token + ":null@" + baseurl,
+            )
+        self.index_url, self.content_url = self.repos[self.sdr_url]
         self.fwget_json_index = self.gen_sdr_fw_json()
         #pprint(self.fwget_json_index)
 
-    def gen_sdr_fw_json(self):
-        index_url = self.index_url
+    def load_index_meta(self):
+        """
+        load the cache metadata of ~/.fwget.json, keyed by sdr_url
+        """
+        meta_filename = os.path.join(os.path.expanduser("~"), self.fwget_json_meta)
+        try:
+            with open(meta_filename, "r", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return {}
+        return meta if isinstance(meta, dict) else {}
+
+    def save_index_meta(self, meta):
+        meta_filename = os.path.join(os.path.expanduser("~"), self.fwget_json_meta)
+        try:
+            with atomic_file(meta_filename) as meta_file:
+                json.dump(meta, meta_file, indent=4, sort_keys=True)
+        except OSError as e:
+            print(f"Unable to write index metadata {meta_filename}. Error: {e}", file=sys.stderr)
+
+    def load_cached_index(self):
+        """
+        load ~/.fwget.json, through its lazily decoded binary copy when that is up to date
+        """
+        binary_index_filename = os.path.join(os.path.expanduser("~"), self.fwget_binary_index)
+        with TIMINGS.span("index.load", format="binary"):
+            self.json_index = FWBinaryIndex.open(binary_index_filename, self.index_stamp())
+        if self.json_index is not None:
+            return self.json_index
+        try:
+            json_index_filename = os.path.join(os.path.expanduser("~"), self.fwget_json)
+            # print(json_index_filename)
+            with TIMINGS.span("index.load", format="json"):
+                with open(json_index_filename, "r", encoding="utf-8") as json_index_file:
+                    self.json_index = json.load(json_index_file)
+                    # print("load json index file is completed")
+        except Exception as e:
+            print(f"Unable to open cached copy of index ~/.fwget.json. Error: {e}")
+            sys.exit(1)
+        with TIMINGS.span("index.build", format="binary"):
+            FWBinaryIndex.write(binary_index_filename, self.json_index, self.index_stamp())
+        return self.json_index
+
+    def repo_cache_name(self, sdr_url):
+        """
+        file under ~ caching the fwrepo.json of sdr_url, ~/.fwget.json itself for a single repository
+        """
+        if len(self.sdr_urls) == 1:
+            return self.fwget_json
+        return os.path.join(self.fwget_repo_dir, hashlib.sha1(sdr_url.encode("utf-8")).hexdigest()[:16] + ".json")
+
+    def load_repo_index(self, sdr_url):
+        try:
+            with TIMINGS.span("index.load", format="json", repo=sdr_url):
+                with open(os.path.join(os.path.expanduser("~"), self.repo_cache_name(sdr_url)), "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Unable to open cached copy of index for {sdr_url}. Error: {e}")
+            sys.exit(1)
+
+    def refresh_repo_index(self, sdr_url, meta):
+        """
+        bring the cached fwrepo.json of one repository up to date
+
+        The cached copy is used as is in offline mode or while it is younger
+        than index_max_age, otherwise it is revalidated with a conditional
+        request so an unchanged repository answers 304 without a transfer.
+        Return the parsed index when it was downloaded, or None when the
+        cached copy is current, together with the new metadata of the cache.
+        """
+        index_url = self.repos[sdr_url][0]
+        cache_name = self.repo_cache_name(sdr_url)
+        json_index_filename = os.path.join(os.path.expanduser("~"), cache_name)
+        cached = (
+            meta is not None
+            and meta.get("file", self.fwget_json) == cache_name
+            and os.path.isfile(json_index_filename)
+        )
+
+        if self.offline:
+            if not cached:
+                print("No cached copy of the firmware index for:")
+                print("   " + sdr_url)
+                print("Please run fwget once without --offline to download it.")
+                sys.exit(1)
+            return None, meta
+
+        if cached and time.time() - meta.get("fetched", 0) < self.index_max_age:
+            return None, meta
+
+        headers = {}
+        if cached and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if cached and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
         try:
-            index = requests.get(index_url, timeout=30)
+            with TIMINGS.span("index.fetch", repo=sdr_url) as span:
+                index = self.http_session().get(index_url, headers=headers)
+                span["status"] = index.status_code
+                span["bytes"] = len(index.content)
+            TIMINGS.count("bytes.index", len(index.content))
+            if index.status_code == 304 and cached:
+                return None, dict(meta, fetched=time.time())
             if index.status_code != 200:
                 raise Exception(index.status_code)
 
-            json_index_filename = f"{os.path.expanduser('~')}/{self.fwget_json}"
-            with open(json_index_filename, "w", encoding="utf-8") as json_index_file:
-                json_index_file.write(index.text)
+            # Parse the response in memory; the file is only a cache for later runs
+            with TIMINGS.span("index.parse", repo=sdr_url):
+                json_index = index.json()
+            os.makedirs(os.path.dirname(json_index_filename), exist_ok=True)
+            with atomic_file(json_index_filename, "wb") as json_index_file:
+                json_index_file.write(index.content)
             # print("Parse firmware metadata on SDR is completed")
+            return json_index, {
+                "etag": index.headers.get("ETag", ""),
+                "last_modified": index.headers.get("Last-Modified", ""),
+                "fetched": time.time(),
+                "file": cache_name,
+            }
         except Exception as error:
             if str(error) == "404":
                 print("Unable to download firmware index (404 not found):")
@@ -212,173 +1658,1691 @@ class FWGet(Configuration):
                 print("generate an access token then add it to ~/.fwget.conf.")
                 sys.exit(1)
             else:
-                print("Unable to download")
-                print("   " + index_url)
-                print("   to ~/fwrepo.json")
-                print(str(error))
+                print("Unable to download")
+                print("   " + index_url)
+                print("   to ~/fwrepo.json")
+                print(str(error))
+                sys.exit(1)
+
+    def gen_sdr_fw_json(self):
+        """
+        return the SDR firmware index, refreshing ~/.fwget.json only when needed
+
+        The indexes of all configured repositories are revalidated
+        concurrently.  With several repositories, ~/.fwget.json holds their
+        merge, each entry tagged with the sdr_url it comes from under "repo";
+        it is only rebuilt when one of them changed.
+        """
+        meta = self.load_index_meta()
+        # The mapping of the binary index outlives the replacement of its file,
+        # so it still holds the previous snapshot once the new one is written
+        binary_index_filename = os.path.join(os.path.expanduser("~"), self.fwget_binary_index)
+        previous = None if self.offline else FWBinaryIndex.open(binary_index_filename, self.index_stamp())
+        with ThreadPoolExecutor(max_workers=len(self.sdr_urls)) as executor:
+            results = list(executor.map(lambda url: self.refresh_repo_index(url, meta.get(url)), self.sdr_urls))
+        fresh = {}
+        for sdr_url, (json_index, repo_meta) in zip(self.sdr_urls, results):
+            meta[sdr_url] = repo_meta
+            if json_index is not None:
+                fresh[sdr_url] = json_index
+
+        json_index_filename = os.path.join(os.path.expanduser("~"), self.fwget_json)
+        if not fresh and meta.get("index") == self.sdr_urls and os.path.isfile(json_index_filename):
+            if previous is not None:
+                previous.close()
+            self.save_index_meta(meta)
+            return self.load_cached_index()
+
+        if len(self.sdr_urls) == 1:
+            self.json_index = fresh.get(self.sdr_url) or self.load_repo_index(self.sdr_url)
+        else:
+            self.json_index = {}
+            for sdr_url in self.sdr_urls:
+                json_index = fresh[sdr_url] if sdr_url in fresh else self.load_repo_index(sdr_url)
+                for fw, entry in json_index.items():
+                    # The first repository listing a package wins
+                    if fw not in self.json_index:
+                        self.json_index[fw] = dict(entry, repo=sdr_url)
+            with atomic_file(json_index_filename) as json_index_file:
+                json.dump(self.json_index, json_index_file)
+
+        if previous is not None:
+            with TIMINGS.span("index.delta"):
+                self.record_delta(self.index_delta(previous, self.json_index))
+            previous.close()
+        with TIMINGS.span("index.build", format="binary"):
+            FWBinaryIndex.write(binary_index_filename, self.json_index, self.index_stamp())
+        with TIMINGS.span("index.build", format="search"):
+            self.save_search_index(self.json_index)
+        meta["index"] = self.sdr_urls
+        self.save_index_meta(meta)
+        return self.json_index
+
+    def index_delta(self, previous, json_index):
+        """
+        compare two snapshots of the index, keyed by filename and by target
+
+        Return the added, removed and changed packages, and for each target of
+        an added package the older packages of that target it supersedes.
+        Each package is summarized by its filename, date, targets and device
+        class, so the history stays small.
+        """
+        def summary(fw, entry):
+            targets = [entry["target"]] if isinstance(entry["target"], str) else list(entry["target"])
+            return {"file": fw, "date": entry["date"], "target": targets, "deviceclass": entry["deviceclass"]}
+
+        previous_names = set(previous)
+        added = [summary(fw, json_index[fw]) for fw in sorted(set(json_index) - previous_names)]
+        removed = [summary(fw, previous[fw]) for fw in sorted(previous_names - set(json_index))]
+        changed = [
+            summary(fw, json_index[fw])
+            for fw in sorted(previous_names.intersection(json_index))
+            if dict(previous[fw]) != dict(json_index[fw])
+        ]
+
+        superseded = []
+        added_targets = {target for item in added for target in item["target"]}
+        if added_targets:
+            by_target = {}
+            for fw, entry in json_index.items():
+                targets = [entry["target"]] if isinstance(entry["target"], str) else entry["target"]
+                for target in added_targets.intersection(targets):
+                    by_target.setdefault(target, []).append((firmware_date(entry["date"]) or "", fw))
+            for item in added:
+                date = firmware_date(item["date"]) or ""
+                older = {}
+                for target in item["target"]:
+                    for older_date, fw in by_target.get(target, ()):
+                        if older_date < date:
+                            older.setdefault(fw, []).append(target)
+                superseded.extend({"file": fw, "by": item["file"], "target": older[fw]} for fw in sorted(older))
+        return {"added": added, "removed": removed, "changed": changed, "superseded": superseded}
+
+    def load_history(self):
+        """
+        return the deltas recorded in ~/.fwget.history, oldest first
+        """
+        history = []
+        try:
+            with open(os.path.join(os.path.expanduser("~"), self.fwget_history), "r", encoding="utf-8") as history_file:
+                for line in history_file:
+                    try:
+                        history.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return history
+
+    def record_delta(self, delta):
+        """
+        append delta to ~/.fwget.history, keeping the last HISTORY_LENGTH ones
+        """
+        if not any(delta.values()):
+            return
+        delta = dict(delta, time=time.strftime("%Y-%m-%dT%H:%M:%S"), repositories=self.sdr_urls)
+        history = self.load_history()[-(self.HISTORY_LENGTH - 1):] + [delta]
+        history_filename = os.path.join(os.path.expanduser("~"), self.fwget_history)
+        try:
+            with atomic_file(history_filename) as history_file:
+                for item in history:
+                    history_file.write(json.dumps(item, sort_keys=True) + "\n")
+        except OSError as e:
+            print(f"Unable to write index history {history_filename}. Error: {e}", file=sys.stderr)
+
+    def package_url(self, file, content_url):
+        """
+        URL of file in the repository it is listed in, or under content_url
+        """
+        repo = self.package_meta(file).get("repo")
+        if repo in self.repos:
+            return self.repos[repo][1] + "/" + file
+        return content_url + "/" + file
+
+    def index_stamp(self):
+        """
+        identify the content of ~/.fwget.json by its modification time and size
+        """
+        try:
+            stat = os.stat(os.path.join(os.path.expanduser("~"), self.fwget_json))
+        except OSError:
+            return ""
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def save_search_index(self, json_index):
+        search_index_filename = os.path.join(os.path.expanduser("~"), self.fwget_search_index)
+        if self.search_postings:
+            self.search_postings.close()
+        FWSearchIndex.write(search_index_filename, json_index, self.index_stamp())
+        # False when it could not be written: search then scans every entry
+        self.search_postings = FWSearchIndex.open(search_index_filename, self.index_stamp()) or False
+
+    def search_candidates(self, searchstring, json_index):
+        """
+        return the names worth checking for searchstring, using the search
+        index persisted next to ~/.fwget.json when json_index is the cached one
+        """
+        if json_index is not self.fwget_json_index:
+            return json_index
+        if self.search_postings is None:
+            search_index_filename = os.path.join(os.path.expanduser("~"), self.fwget_search_index)
+            self.search_postings = FWSearchIndex.open(search_index_filename, self.index_stamp())
+            if self.search_postings is None:
+                self.save_search_index(json_index)
+        if not self.search_postings:
+            return json_index
+        candidates = self.search_postings.candidates(searchstring)
+        return json_index if candidates is None else candidates
+
+    def search_match(self, searchstring, fw, entry):
+        """
+        whether the lowercased searchstring matches the filename, description, target or deviceclass
+        """
+        return (
+            searchstring in fw.lower()
+            or searchstring in entry["description"].lower()
+            or searchstring in entry["target"]
+            or searchstring in entry["deviceclass"].lower()
+        )
+
+    def locate_match(self, searchstring, fw, entry):
+        """
+        whether the lowercased searchstring matches the filename or description
+        """
+        return searchstring in fw.lower() or searchstring in entry["description"].lower()
+
+    def search_index(self, searchstring, json_index):
+        """
+        substring search in filename, description, target and deviceclass
+
+        Return (date, filename, description, target, deviceclass) tuples sorted
+        by date, newest first.
+        """
+        return sorted(self.search_matches(searchstring, json_index), key=lambda tup: tup[0], reverse=True)
+
+    def search_matches(self, searchstring, json_index):
+        """
+        yield the (date, filename, description, target, deviceclass) tuples of search_index, unsorted
+        """
+        searchstring = searchstring.lower()
+        for fw in self.search_candidates(searchstring, json_index):
+            entry = json_index[fw]
+            if self.search_match(searchstring, fw, entry):
+                yield entry["date"], fw, entry["description"], entry["target"], entry["deviceclass"]
+
+    def select(self, items, json_index, key, reverse):
+        """
+        order (date, filename, ...) tuples by key, or as --sort asks, and apply
+        --newest-per-target, --offset and --limit
+
+        With --limit, only offset + limit tuples are kept in a bounded heap
+        instead of sorting them all.  Ties keep the order of items, as a full
+        sort would.
+        """
+        options = self.fwget_options
+        sort = options.get("sort")
+        if sort == "date":
+            key, reverse = (lambda tup: tup[0]), True
+        elif sort == "name":
+            key, reverse = (lambda tup: tup[1]), False
+        elif sort:
+            print(f"Error: --sort takes date or name, not \"{sort}\"")
+            sys.exit(1)
+        try:
+            offset = max(0, int(options.get("offset", 0)))
+            limit = max(0, int(options["limit"])) if options.get("limit") else None
+        except ValueError:
+            print("Error: --offset and --limit take a number of results")
+            sys.exit(1)
+
+        if options.get("newest-per-target"):
+            items = self.newest_per_target(items, json_index)
+        if limit is not None:
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            return select(offset + limit, items, key=key)[offset:]
+        return sorted(items, key=key, reverse=reverse)[offset:]
+
+    def newest_per_target(self, items, json_index):
+        """
+        keep the tuples whose entry is the newest for at least one of its
+        targets, and those without a target, as sync --latest does
+        """
+        items = list(items)
+        newest_by_target = {}
+        for item in items:
+            date, fw = item[0], item[1]
+            targets = json_index[fw]["target"]
+            for target in [targets] if isinstance(targets, str) else targets:
+                if target not in newest_by_target or date > newest_by_target[target][0]:
+                    newest_by_target[target] = (date, fw)
+        newest = {fw for _, fw in newest_by_target.values()}
+        return [item for item in items if item[1] in newest or not json_index[item[1]]["target"]]
+
+    def search(self, searchstring, json_index):
+        """
+        search substring search in filename and description, secretly sort output by date
+        """
+        with TIMINGS.span("query") as span:
+            results = self.select(
+                self.search_matches(searchstring, json_index), json_index, key=lambda tup: tup[0], reverse=True
+            )
+            span["results"] = len(results)
+        with TIMINGS.span("output"), buffered_output() as output:
+            for item in results:
+                output.write(str(item[1]).ljust(66) + "   " + ascii_text(item[2]) + "\n")
+        return 0
+
+    def locate_index(self, searchstring, json_index):
+        """
+        substring search in filename and description, return (date, filename) sorted by date, newest first
+        """
+        return sorted(self.locate_matches(searchstring, json_index), key=lambda tup: tup[0], reverse=True)
+
+    def locate_matches(self, searchstring, json_index):
+        """
+        yield the (date, filename) tuples of locate_index, unsorted
+        """
+        searchstring = searchstring.lower()
+        for fw in self.search_candidates(searchstring, json_index):
+            if self.locate_match(searchstring, fw, json_index[fw]):
+                yield json_index[fw]["date"], fw
+
+    def locate(self, searchstring, json_index, content_url):
+        """
+        locate substring search in filename and description, output urls secretly sorted by date
+        """
+        with TIMINGS.span("query") as span:
+            results = self.select(
+                self.locate_matches(searchstring, json_index), json_index, key=lambda tup: tup[0], reverse=True
+            )
+            span["results"] = len(results)
+        with TIMINGS.span("output"), buffered_output() as output:
+            for item in results:
+                output.write(self.package_url(item[1], content_url) + "\n")
+        return 0
+
+    def query_index(self, query, json_index):
+        """
+        return the names of the entries matching a parsed FWQuery, in index order
+        """
+        if self.query_columns is None or self.query_columns.json_index is not json_index:
+            self.query_columns = FWColumns(json_index)
+        return query.names(self.query_columns)
+
+    def query(self, text, json_index):
+        """
+        structured search with field qualifiers, and/or/not, regular expressions and date ranges, newest first
+        """
+        try:
+            query = FWQuery(text)
+        except ValueError as error:
+            print(f"Error: invalid query: {error}")
+            sys.exit(1)
+        with TIMINGS.span("query") as span:
+            names = self.query_index(query, json_index)
+            results = self.select(
+                ((json_index[fw]["date"], fw) for fw in names), json_index, key=lambda tup: tup[0], reverse=True
+            )
+            span["results"] = len(results)
+        if self.fwget_options.get("ndjson"):
+            with TIMINGS.span("output"):
+                self.batch_output(text, [fw for _, fw in results], json_index, ordered=True)
+            return 0
+        with TIMINGS.span("output"), buffered_output() as output:
+            for _, fw in results:
+                output.write(str(fw).ljust(66) + "   " + ascii_text(json_index[fw]["description"]) + "\n")
+        return 0
+
+    def batch(self, operation, terms, json_index):
+        """
+        answer many search or locate terms from one loaded index, as NDJSON
+
+        Terms long enough for the search index are answered from their
+        candidates as soon as they are read, so results stream while the
+        input is still arriving; shorter terms are collected and matched
+        together in a single scan of the index once the input ends.
+        """
+        match = self.search_match if operation == "search" else self.locate_match
+        seen = set()
+        short_terms = {}
+        for term in terms:
+            searchstring = term.lower()
+            if searchstring in seen:
+                continue
+            seen.add(searchstring)
+            if len(searchstring) < SEARCH_NGRAM:
+                short_terms[searchstring] = (term, [])
+                continue
+            with TIMINGS.span("query", term=term):
+                matches = [
+                    fw for fw in self.search_candidates(searchstring, json_index)
+                    if match(searchstring, fw, json_index[fw])
+                ]
+            self.batch_output(term, matches, json_index)
+
+        if short_terms:
+            with TIMINGS.span("query", terms=len(short_terms)):
+                for fw in json_index:
+                    entry = json_index[fw]
+                    for searchstring, (term, matches) in short_terms.items():
+                        if match(searchstring, fw, entry):
+                            matches.append(fw)
+            for term, matches in short_terms.values():
+                self.batch_output(term, matches, json_index)
+        return 0
+
+    def batch_output(self, term, matches, json_index, ordered=False):
+        """
+        write one NDJSON line per match of term, newest first unless matches are already ordered
+        """
+        lines = []
+        items = ((json_index[fw]["date"], fw) for fw in matches)
+        for date, fw in items if ordered else sorted(items, key=lambda tup: tup[0], reverse=True):
+            entry = json_index[fw]
+            lines.append(json.dumps({
+                "query": term,
+                "date": date,
+                "file": fw,
+                "description": entry["description"],
+                "target": entry["target"],
+                "deviceclass": entry["deviceclass"],
+                "url": self.package_url(fw, self.content_url),
+            }) + "\n")
+        sys.stdout.write("".join(lines))
+        sys.stdout.flush()
+
+    def report_progress(self, file, done, total, received, started, final=False):
+        """
+        report transfer progress and rate on stderr, rewriting one line on a terminal
+        """
+        now = time.time()
+        live = sys.stderr.isatty() and not self.progress_quiet
+        if not final and (not live or now - self.progress_reported < 0.5):
+            return
+        self.progress_reported = now
+        rate = received / max(now - started, 0.001)
+        size = f"{done}/{total}" if total else f"{done}"
+        line = f"  {file}: {size} bytes, {rate / 1024:.1f} KiB/s"
+        # One write per line, so concurrent transfers do not interleave their reports
+        with self.progress_lock:
+            if live:
+                sys.stderr.write("\r" + line + ("\n" if final else ""))
+                sys.stderr.flush()
+            else:
+                sys.stderr.write(line + "\n")
+
+    def http_session(self):
+        """
+        return the Transport shared by every request, with one pooled
+        keep-alive connection per concurrent download and segment to each repository
+        """
+        if self.session is None:
+            pool_size = self.download_workers * self.download_segments
+            self.session = self.transport(pool_size, hosts=len(self.sdr_urls))
+        return self.session
+
+    def fetch_file(self, url, file, priority=1.0):
+        """
+        stream url into file in fixed-size chunks and return its sha256
+
+        Data goes to <file>.part first and is renamed into place once
+        complete; an existing .part file is resumed with a Range request.
+        <file>.part.validator keeps the ETag or Last-Modified of the build
+        being fetched and is sent as If-Range, so a file that changed since
+        is fetched again from the start; a .part without one is discarded.
+        The checksum is computed while the data streams in, only a resumed
+        .part file is read back once.  Large files are fetched as several
+        byte ranges at once when download_segments is above 1, see
+        fetch_segments.  The transfer takes its priority's share of the
+        download rate cap.
+        """
+        part_file = file + ".part"
+        if self.download_segments > 1 or os.path.isfile(part_file + ".segments"):
+            digest = self.fetch_segments(url, file, priority)
+            if digest:
+                return digest
+        validator_file = part_file + ".validator"
+        offset = os.path.getsize(part_file) if os.path.isfile(part_file) else 0
+        validator = {}
+        if offset:
+            try:
+                with open(validator_file, "r", encoding="utf-8") as f:
+                    validator = json.load(f)
+            except (OSError, ValueError):
+                pass
+        if_range = validator.get("etag") or validator.get("last_modified") if isinstance(validator, dict) else None
+        if offset and not if_range:
+            # Nothing tells which build the partial file belongs to
+            offset = 0
+        headers = {"Range": f"bytes={offset}-", "If-Range": if_range} if offset else {}
+        sha256 = hashlib.sha256()
+        if offset:
+            with open(part_file, "rb") as firmware_file:
+                for chunk in iter(lambda: firmware_file.read(DOWNLOAD_CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+
+        session = self.http_session()
+        with session.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 416 and offset:
+                # The partial file is already complete, or belongs to an older build
+                content_range = response.headers.get("Content-Range", "")
+                if content_range == f"bytes */{offset}":
+                    os.replace(part_file, file)
+                    os.remove(validator_file)
+                    return sha256.hexdigest()
+                os.remove(part_file)
+                return self.fetch_file(url, file, priority)
+            if response.status_code == 200:
+                offset = 0  # the file changed or the server ignored the Range header, start over
+                sha256 = hashlib.sha256()
+            elif response.status_code != 206:
+                raise Exception(response.status_code)
+            etag = response.headers.get("ETag", "")
+            if offset and validator.get("etag") and etag and etag != validator["etag"]:
+                # The server sent a range of another build despite If-Range
+                response.close()
+                os.remove(part_file)
+                return self.fetch_file(url, file, priority)
+            if not offset:
+                # A weak ETag cannot be used in If-Range
+                validator = {
+                    "etag": "" if etag.startswith("W/") else etag,
+                    "last_modified": response.headers.get("Last-Modified", ""),
+                }
+                with atomic_file(validator_file) as f:
+                    json.dump(validator, f)
+
+            length = response.headers.get("Content-Length")
+            total = offset + int(length) if length else 0
+            received = 0
+            started = self.progress_reported = time.time()
+            with TIMINGS.span("transfer", file=os.path.basename(file), offset=offset) as span:
+                with open(part_file, "ab" if offset else "wb") as firmware_file, BANDWIDTH.transfer(priority) as throttle:
+                    for chunk in response.iter_content(BANDWIDTH.chunk_size()):
+                        firmware_file.write(chunk)
+                        sha256.update(chunk)
+                        received += len(chunk)
+                        throttle(len(chunk))
+                        self.report_progress(file, offset + received, total, received, started)
+                span["bytes"] = received
+            TIMINGS.count("bytes.downloaded", received)
+            self.report_progress(file, offset + received, total, received, started, final=True)
+
+        if total and os.path.getsize(part_file) != total:
+            raise Exception(f"incomplete transfer of {file}, run the download again to resume")
+        os.replace(part_file, file)
+        os.remove(validator_file)
+        return sha256.hexdigest()
+
+    def fetch_segments(self, url, file, priority):
+        """
+        fetch url into file as download_segments byte ranges at once, and return its sha256
+
+        A one-byte range request gives the size of the file and tells whether
+        the server honours ranges.  <file>.part is then preallocated to that
+        size and every range is written in place with pwrite by its own
+        connection.  <file>.part.segments records how far each range got, so
+        an interrupted download resumes its ranges, as long as the size and
+        ETag of the file are unchanged.  The segments share the priority of
+        the download.  Return None when the file is too small to split or the
+        server ignores ranges, for fetch_file to stream it as a whole.
+        """
+        part_file = file + ".part"
+        state_file = part_file + ".segments"
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if not state and os.path.isfile(part_file):
+            # Left by a single-stream download, which fetch_file resumes
+            return None
+        listed = ((self.fwget_json_index or {}).get(os.path.basename(file)) or {}).get("size")
+        if not state and listed is not None and int(listed) < 2 * DOWNLOAD_SEGMENT_MIN_SIZE:
+            return None
+        with self.http_session().get(url, headers={"Range": "bytes=0-0"}, stream=True) as probe:
+            content_range = probe.headers.get("Content-Range", "")
+            etag = probe.headers.get("ETag", "")
+            if probe.status_code not in (200, 206, 416):
+                raise Exception(probe.status_code)
+        match = re.fullmatch(r"bytes 0-0/(\d+)", content_range.strip())
+        size = int(match.group(1)) if probe.status_code == 206 and match else 0
+        if state and (state.get("size") != size or state.get("etag", "") != etag):
+            # The file changed since its ranges were started
+            state = {}
+            for name in (state_file, part_file):
+                if os.path.isfile(name):
+                    os.remove(name)
+        segments = min(self.download_segments, size // DOWNLOAD_SEGMENT_MIN_SIZE)
+        if not state and segments < 2:
+            return None
+
+        if not state:
+            bounds = [size * i // segments for i in range(segments + 1)]
+            # [first byte, last byte, bytes received] of each range
+            state = {"size": size, "etag": etag, "segments": [[bounds[i], bounds[i + 1] - 1, 0] for i in range(segments)]}
+        ranges = state["segments"]
+        lock = threading.Lock()
+        save_lock = threading.Lock()
+        progress = {"done": sum(segment[2] for segment in ranges), "received": 0, "saved": time.time()}
+        started = self.progress_reported = time.time()
+
+        def save_state():
+            # Ranges only count bytes already written, so the state never runs ahead of the file
+            with save_lock:
+                with lock:
+                    data = json.dumps(state)
+                    progress["saved"] = time.time()
+                with atomic_file(state_file) as f:
+                    f.write(data)
+
+        def fetch_range(segment):
+            first, last = segment[0], segment[1]
+            session = self.http_session()
+            for attempt in range(self.http_retries + 1):
+                if first + segment[2] > last:
+                    return
+                headers = {"Range": f"bytes={first + segment[2]}-{last}"}
+                try:
+                    with session.get(url, headers=headers, stream=True) as response:
+                        if response.status_code != 206:
+                            raise Exception(response.status_code)
+                        with BANDWIDTH.transfer(priority / len(ranges)) as throttle:
+                            for chunk in response.iter_content(BANDWIDTH.chunk_size()):
+                                chunk = chunk[: last + 1 - first - segment[2]]
+                                os.pwrite(fd, chunk, first + segment[2])
+                                throttle(len(chunk))
+                                with lock:
+                                    segment[2] += len(chunk)
+                                    progress["done"] += len(chunk)
+                                    progress["received"] += len(chunk)
+                                self.report_progress(file, progress["done"], size, progress["received"], started)
+                                if time.time() - progress["saved"] >= 1:
+                                    save_state()
+                except requests.RequestException:
+                    # The connection broke mid-range: the next attempt continues from the last byte written
+                    if attempt == self.http_retries:
+                        raise
+                    time.sleep(session.retry_delay(attempt))
+            if first + segment[2] <= last:
+                raise Exception(f"incomplete transfer of {file}, run the download again to resume")
+
+        save_state()
+        fd = os.open(part_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, size)
+                else:
+                    os.ftruncate(fd, size)
+            with TIMINGS.span("transfer", file=os.path.basename(file), segments=len(ranges)) as span:
+                with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                    futures = [executor.submit(fetch_range, segment) for segment in ranges]
+                    errors = [future.exception() for future in futures if future.exception()]
+                span["bytes"] = progress["received"]
+        finally:
+            os.close(fd)
+            save_state()
+        TIMINGS.count("bytes.downloaded", progress["received"])
+        if errors:
+            raise errors[0]
+        self.report_progress(file, progress["done"], size, progress["received"], started, final=True)
+        os.replace(part_file, file)
+        os.remove(state_file)
+        # The ranges arrive out of order, so the checksum is computed once they are all in place
+        with TIMINGS.span("checksum", file=os.path.basename(file)):
+            return file_digest(file)[2]
+
+    def package_meta(self, file):
+        """
+        return the index entry of file, or of its .fwpkg for a companion .json
+        """
+        json_index = self.fwget_json_index or {}
+        for name in (file, file[: -len(".json")] + ".fwpkg" if file.endswith(".json") else None):
+            if name and name in json_index:
+                return json_index[name]
+        return {}
+
+    def cache_key(self, file):
+        """
+        name of file in the package cache: its sha256 when the index has one,
+        otherwise a hash of its location, size and date
+        """
+        entry = self.package_meta(file)
+        if entry.get("sha256") and file in (self.fwget_json_index or {}):
+            return "sha256-" + entry["sha256"].lower()
+        location = f"{entry.get('repo', self.sdr_url)}/{file}|{entry.get('size', '')}|{entry.get('date', '')}"
+        return "url-" + hashlib.sha256(location.encode("utf-8")).hexdigest()
+
+    def cache_place(self, source, path, link=True):
+        """
+        hardlink source to path, or copy it when link is false or across file
+        systems, replacing path atomically
+        """
+        tmp_path = tmp_name(path)
+        try:
+            if link:
+                try:
+                    os.link(source, tmp_path)
+                except OSError:
+                    link = False
+            if not link:
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+            # Renaming a link over another link to the same file leaves both in place
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    def cache_evict(self, objects_dir, max_size=None, keep=None):
+        """
+        remove the least recently used objects until the cache fits in max_size MB, package_cache_max_size by default;
+        the object keep is never removed
+        """
+        objects = []
+        for item in os.scandir(objects_dir):
+            if item.is_file() and not item.name.endswith(".tmp") and item.path != keep:
+                stat = item.stat()
+                objects.append((stat.st_mtime, stat.st_size, item.path))
+        total = sum(size for _, size, _ in objects)
+        limit = (self.package_cache_max_size if max_size is None else max_size) * 1024 * 1024
+        for _, size, path in sorted(objects):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def download_file(self, file, url, path, use_cache=True):
+        """
+        fetch one file, serving it from the package cache when possible and
+        checking it against the sha256 and size of the index when present;
+        use_cache false bypasses the cache
+        """
+        use_cache = use_cache and str(self.package_cache).lower() != "no"
+        objects_dir = os.path.join(self.package_cache, "objects")
+        cached = os.path.join(objects_dir, self.cache_key(file))
+        size = self.package_meta(file).get("size") if file in (self.fwget_json_index or {}) else None
+        if use_cache and os.path.isfile(cached) and (size is None or int(size) == os.path.getsize(cached)):
+            try:
+                # Copied out, so the user's file never shares its inode with the cache
+                self.cache_place(cached, path, link=False)
+            except FileNotFoundError:
+                pass  # evicted meanwhile, download it
+            else:
+                # Most recently used; a shared cache owned by another user may not allow it, which is harmless
+                with contextlib.suppress(OSError):
+                    os.utime(cached)
+                print(f"download {file} ... (cached)")
+                return file
+
+        print(f"download {file} ...")
+        # A companion .json shares the priority of its package
+        package = file[: -len(".json")] + ".fwpkg" if file.endswith(".json") else file
+        digest = self.fetch_file(url, path, self.download_priorities.get(package, self.download_priority))
+        entry = self.package_meta(file) if file in (self.fwget_json_index or {}) else {}
+        if entry.get("sha256") and entry["sha256"].lower() != digest:
+            os.remove(path)
+            raise Exception(f"checksum mismatch for {file}: expected {entry['sha256']}, got {digest}")
+        if entry.get("size") is not None and int(entry["size"]) != os.path.getsize(path):
+            os.remove(path)
+            raise Exception(f"size mismatch for {file}: expected {entry['size']}, got {os.path.getsize(path)}")
+
+        if use_cache:
+            try:
+                os.makedirs(objects_dir, exist_ok=True)
+                # Linked in rather than written a second time; hits get their own copy
+                self.cache_place(path, cached)
+                self.cache_evict(objects_dir)
+            except OSError as e:
+                print(f"Unable to add {file} to the package cache: {e}", file=sys.stderr)
+        return file
+
+    def list_lines(self, list_file, what):
+        """
+        yield the non-empty, non-comment lines of list_file, or of stdin for "-", as they are read
+        """
+        try:
+            lines = contextlib.nullcontext(sys.stdin) if list_file == "-" else open(list_file, "r", encoding="utf-8")
+        except OSError as e:
+            print(f"Unable to read {what} {list_file}. Error: {e}")
+            sys.exit(1)
+        with lines as stream:
+            for line in stream:
+                if line.strip() and not line.startswith("#"):
+                    yield line.strip()
+
+    def download_names(self, json_index):
+        """
+        collect the files to download from the command line, --file and --search
+        """
+        names = self.fwget_args[2:]
+        list_file = self.fwget_options.get("file")
+        if list_file:
+            # A line is a file name, optionally followed by its priority
+            for line in self.list_lines(list_file, "download list"):
+                name, _, priority = line.partition(" ")
+                names.append(name)
+                if priority.strip():
+                    try:
+                        self.download_priorities[name] = max(0.001, float(priority))
+                    except ValueError:
+                        print(f"Error: \"{priority.strip()}\" is not a valid priority for {name}")
+                        sys.exit(1)
+        searchstring = self.fwget_options.get("search")
+        if searchstring:
+            names += [item[1] for item in self.search_index(searchstring, json_index)]
+        # Drop duplicates but keep the order given by the user
+        return list(dict.fromkeys(names))
+
+    def download_error(self, error, file, url):
+        if str(error) == "404":
+            print(f"Unable to download {file} (404 not found):")
+            print("   " + url)
+        elif str(error) == "401":
+            print(f"""
+                Unable to download {file} (401 not authorized)
+                A valid warranty or support contract is required to access HPE firmware."
+                Please visit http://downloads.linux.hpe.com/SDR/project/fwpp/ to "
+                generate an access token then add it to ~/.fwget.conf.
+            """)
+        else:
+            print(f"Unable to download {file}.")
+            print(str(error))
+
+    def companion_json(self, file, url):
+        """
+        return the decoupled JSON file that goes with a .fwpkg, or None
+        """
+        # Download the decoupled JSON file corresponding to fwpkg, introduced starting from Gen12 SPP
+        if file.endswith(".fwpkg") and not any(re.search(gen, url) for gen in gen_for_old_fwpkg):
+            return file.replace(".fwpkg", ".json")
+        return None
+
+    def fetch_files(self, jobs, use_cache=True):
+        """
+        fetch (file, url, path) jobs concurrently over the shared session and
+        return the files that failed, after reporting each error; use_cache
+        false keeps them out of the package cache
+        """
+        # Rewriting a progress line only makes sense for a single transfer
+        self.progress_quiet = len(jobs) > 1
+        failures = []
+        if not jobs:
+            return failures
+        with ThreadPoolExecutor(max_workers=min(self.download_workers, len(jobs))) as executor:
+            futures = {executor.submit(self.download_file, file, url, path, use_cache): (file, url) for file, url, path in jobs}
+            for future in as_completed(futures):
+                file, url = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    self.download_error(error, file, url)
+                    failures.append(file)
+        return failures
+
+    ##########
+    # download download files supplied on command name, no wildcards
+    def download(self, files, content_url):
+        """
+        download files concurrently over the shared session
+
+        Each .fwpkg is paired with its companion .json in the same batch.
+        Every file is fetched once, however often it is named.  Failures are collected and summarized instead of stopping the batch.
+        """
+        # Keyed by file name: a file named twice, or also as a companion, is fetched once,
+        # as two transfers would write the same .part file
+        jobs = {}
+        for file in files:
+            url = self.package_url(file, content_url)
+            jobs.setdefault(file, (file, url, file))
+            json_file = self.companion_json(file, url)
+            if json_file:
+                jobs.setdefault(json_file, (json_file, self.package_url(json_file, content_url), json_file))
+        jobs = list(jobs.values())
+
+        if not jobs:
+            print("Nothing to download.")
+            return 0
+
+        failures = self.fetch_files(jobs)
+        if len(jobs) > 1:
+            print(f"\n{len(jobs) - len(failures)} of {len(jobs)} files downloaded.")
+            for file in failures:
+                print(f"   failed: {file}")
+        if failures:
+            sys.exit(1)
+        return 0
+
+    ##########
+    # verify   check downloaded files against the checksum and size of the index
+    def verify(self, files, json_index):
+        """
+        hash files in parallel worker processes and compare them with the index
+
+        Without file arguments, every file of the current directory that is
+        listed in the index is checked.
+        """
+        if not files:
+            files = sorted(name for name in os.listdir(".") if name in json_index and os.path.isfile(name))
+        if not files:
+            print("Nothing to verify.")
+            return 0
+
+        failures = 0
+        # Imported here as it pulls in multiprocessing, which no other command needs
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor() as executor:
+            for path, size, digest in executor.map(file_digest, files):
+                entry = json_index[os.path.basename(path)] if os.path.basename(path) in json_index else {}
+                if size is None:
+                    status = f"FAILED ({digest})"
+                elif entry.get("sha256") and entry["sha256"].lower() != digest:
+                    status = "FAILED (checksum mismatch)"
+                elif entry.get("size") is not None and int(entry["size"]) != size:
+                    status = "FAILED (size mismatch)"
+                elif entry.get("sha256"):
+                    status = "OK"
+                elif not entry:
+                    status = "UNKNOWN (not in index)"
+                else:
+                    status = "UNKNOWN (no checksum in index)"
+                if status.startswith("FAILED"):
+                    failures += 1
+                line = f"{path}: {status}"
+                if status.startswith("UNKNOWN"):
+                    line += f"  sha256 {digest}"
+                print(line)
+        if failures:
+            print(f"\n{failures} of {len(files)} files failed verification.")
+            sys.exit(1)
+        return 0
+
+    def sync_select(self, json_index):
+        """
+        return the names of the index entries matching the sync filters
+        """
+        options = self.fwget_options
+        deviceclass = str(options.get("deviceclass", "")).lower()
+        target = str(options.get("target", "")).lower()
+        since = firmware_date(options["since"]) if options.get("since") else None
+        until = firmware_date(options["until"]) if options.get("until") else None
+        for name, value in (("since", since), ("until", until)):
+            if options.get(name) and value is None:
+                print(f"Error: \"{options[name]}\" is not a valid date (YYYY-MM-DD)")
+                sys.exit(1)
+        if options.get("search"):
+            names = [item[1] for item in self.search_index(options["search"], json_index)]
+        else:
+            names = list(json_index)
+
+        selected = []
+        newest_by_target = {}
+        for fw in names:
+            entry = json_index[fw]
+            targets = [entry["target"]] if isinstance(entry["target"], str) else entry["target"]
+            if deviceclass and entry["deviceclass"].lower() != deviceclass:
+                continue
+            if target and target not in [t.lower() for t in targets]:
+                continue
+            date = firmware_date(entry["date"]) or ""
+            if (since and date < since) or (until and date > until):
+                continue
+            selected.append(fw)
+            for t in targets:
+                if t not in newest_by_target or date > newest_by_target[t][0]:
+                    newest_by_target[t] = (date, fw)
+
+        if options.get("latest"):
+            # Older packages for a target are superseded by its newest one
+            newest = {fw for _, fw in newest_by_target.values()}
+            selected = [fw for fw in selected if fw in newest or not json_index[fw]["target"]]
+        return selected
+
+    def load_manifest(self, directory):
+        try:
+            with open(os.path.join(directory, SYNC_MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def sync_link(self, file, date, path, link_dests):
+        """
+        hardlink file from another mirror holding the same package, copying across file systems
+        """
+        for link_dir, manifest in link_dests:
+            source = os.path.join(link_dir, file)
+            known = manifest.get(file)
+            if not known or known.get("date") != date or not os.path.isfile(source):
+                continue
+            if known.get("size") is not None and os.path.getsize(source) != known["size"]:
+                continue
+            if os.path.lexists(path):
+                os.remove(path)
+            try:
+                os.link(source, path)
+            except OSError:
+                shutil.copy2(source, path)
+            return True
+        return False
+
+    ##########
+    # sync     mirror the selected packages into a local directory, fetching only the delta
+    def sync(self, directory, json_index, content_url):
+        """
+        mirror packages of the index into directory
+
+        A manifest in the mirror records the date and size of every package,
+        so only new or changed packages are fetched.  Packages already present
+        in a --link-dest mirror are hardlinked instead of downloaded.  Packages
+        no longer selected are deleted with --prune and retained otherwise.
+        The selected entries are written to fwrepodata/fwrepo.json so the
+        mirror can be used as an sdr_url.
+        """
+        os.makedirs(directory, exist_ok=True)
+        selected = self.sync_select(json_index)
+        # A name such as ../x or /x from the index would be written outside the mirror
+        rejected = [fw for fw in selected if not plain_file_name(fw)]
+        selected = [fw for fw in selected if plain_file_name(fw)]
+        manifest = self.load_manifest(directory)
+        link_dirs = [d for d in str(self.fwget_options.get("link-dest", "")).split(",") if d]
+        link_dests = [(d, self.load_manifest(d)) for d in link_dirs]
+
+        wanted = {}
+        jobs = []
+        linked = unchanged = 0
+        for fw in selected:
+            url = self.package_url(fw, content_url)
+            files = [fw]
+            json_file = self.companion_json(fw, url)
+            if json_file:
+                files.append(json_file)
+            for file in files:
+                date = json_index[fw]["date"]
+                path = os.path.join(directory, file)
+                wanted[file] = date
+                known = manifest.get(file)
+                if known and known.get("date") == date and os.path.isfile(path):
+                    unchanged += 1
+                elif self.sync_link(file, date, path, link_dests):
+                    manifest[file] = {"date": date, "size": os.path.getsize(path)}
+                    linked += 1
+                else:
+                    jobs.append((file, self.package_url(file, content_url), path))
+
+        # A mirror is its own copy of the packages; keeping a second one in the cache would only churn it
+        failures = self.fetch_files(jobs, use_cache=False)
+        for file, url, path in jobs:
+            if file not in failures:
+                manifest[file] = {"date": wanted[file], "size": os.path.getsize(path)}
+
+        removed = 0
+        for file in list(manifest):
+            if file in wanted:
+                manifest[file].pop("superseded", None)
+            elif self.fwget_options.get("prune"):
+                path = os.path.join(directory, file)
+                if os.path.isfile(path):
+                    os.remove(path)
+                del manifest[file]
+                removed += 1
+            else:
+                manifest[file]["superseded"] = True
+
+        with atomic_file(os.path.join(directory, SYNC_MANIFEST)) as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+        os.makedirs(os.path.join(directory, "fwrepodata"), exist_ok=True)
+        # Replaced in one step, so clients of the mirror never read a partial index
+        index_file = os.path.join(directory, "fwrepodata", "fwrepo.json")
+        with atomic_file(index_file) as f:
+            json.dump(
+                {fw: {key: value for key, value in json_index[fw].items() if key != "repo"} for fw in selected}, f
+            )
+
+        print(
+            f"\n{len(jobs) - len(failures)} downloaded, {linked} linked, {unchanged} unchanged, "
+            f"{removed} removed, {len(failures)} failed."
+        )
+        for file in failures:
+            print(f"   failed: {file}")
+        for file in rejected:
+            print(f"   rejected: {file!r} is not a plain file name")
+        if failures or rejected:
+            sys.exit(1)
+        return 0
+
+    ##########
+    # list     everything, sorted by filename
+    def list(self, json_index):
+        options = self.fwget_options
+        with TIMINGS.span("query") as span:
+            # Dates are only decoded when the order or the filter needs them,
+            # descriptions only for the entries printed
+            if options.get("sort") == "date" or options.get("newest-per-target"):
+                items = ((json_index[fw]["date"], fw) for fw in json_index)
+            else:
+                items = (("", fw) for fw in json_index)
+            output_list = self.select(items, json_index, key=lambda tup: tup[1], reverse=True)
+            span["results"] = len(output_list)
+        with TIMINGS.span("output"), buffered_output() as output:
+            for _, fw in output_list:
+                output.write(str(fw).ljust(33) + "   " + ascii_text(json_index[fw]["description"]) + "\n")
+        return 0
+
+    ##########
+    # changes  what the index refreshes added, removed, changed or superseded
+    def changes(self):
+        """
+        print the recorded index changes since --since, or those of the last
+        refresh that changed the index, for --target and --deviceclass
+        """
+        options = self.fwget_options
+        since = firmware_date(options["since"]) if options.get("since") else None
+        if options.get("since") and since is None:
+            print(f"Error: \"{options['since']}\" is not a valid date (YYYY-MM-DD)")
+            sys.exit(1)
+        target = str(options.get("target", "")).lower()
+        deviceclass = str(options.get("deviceclass", "")).lower()
+
+        history = self.load_history()
+        if since is None:
+            history = history[-1:]
+        rows = []
+        for delta in history:
+            if since and delta.get("time", "")[:10] < since:
+                continue
+            for change in ("added", "removed", "changed", "superseded"):
+                for item in delta.get(change, ()):
+                    if target and target not in [t.lower() for t in item["target"]]:
+                        continue
+                    if deviceclass and change != "superseded" and item["deviceclass"].lower() != deviceclass:
+                        continue
+                    rows.append(dict(item, refreshed=delta.get("time", ""), change=change))
+        if deviceclass:
+            # Keep the supersessions of the packages that passed the device class filter
+            added = {row["file"] for row in rows if row["change"] == "added"}
+            rows = [row for row in rows if row["change"] != "superseded" or row["by"] in added]
+
+        with TIMINGS.span("output"), buffered_output() as output:
+            if not history and not options.get("json"):
+                output.write("No index changes recorded yet.\n")
+            for row in rows:
+                if options.get("json"):
+                    output.write(json.dumps(row, sort_keys=True) + "\n")
+                    continue
+                line = row["refreshed"].ljust(19) + "   " + row["change"].ljust(10) + "   " + row["file"].ljust(33)
+                if row["change"] == "superseded":
+                    line += "   by " + row["by"]
+                else:
+                    line += "   " + row["date"] + "   " + row["deviceclass"]
+                output.write(line + "\n")
+        return 0
+
+    def load_inventory(self):
+        """
+        return the fwlist odata_list, read live from the iLO with --live or
+        otherwise from ~/.fwlist.output in any fwlist export format
+        """
+        fwlist = FWList([FWLIST])
+        if self.fwget_options.get("live"):
+            fwlist.fwlist_config_parser()
+            session = fwlist.redfish_session()
+            token, session_url = fwlist.redfish_connect(session)
+            if not token:
+                print("\n------------- Redfish Login fail -----------------\n")
                 sys.exit(1)
+            odata_list = fwlist.firmware_parse(session, session_url)
+            fwlist.redfish_disconnect(session)
+            return odata_list
 
         try:
-            json_index_filename = os.path.join(os.path.expanduser("~"), self.fwget_json)
-            # print(json_index_filename)
-            with open(json_index_filename, "r", encoding="utf-8") as json_index_file:
-                self.json_index = json.load(json_index_file)
-                # print("load json index file is completed")
-        except Exception as e:
-            print(f"Unable to open cached copy of index ~/.fwget.json. Error: {e}")
+            with open(fwlist.odataid_file, "r", encoding="utf-8") as f:
+                content = f.read()
+        except OSError as e:
+            print(f"Unable to read {fwlist.odataid_file}: {e}")
+            print("Please run fwlist first, or use --live to read the inventory from the iLO.")
             sys.exit(1)
-        return self.json_index
+        content = content.strip()
+        if content.startswith("["):
+            return json.loads(content)
+        if content.startswith("{"):
+            return [json.loads(line) for line in content.splitlines() if line.strip()]
+        if content.startswith(",".join(FWListExport.CSV_COLUMNS)):
+            import csv
 
-    def search(self, searchstring, json_index):
+            odata_list = list(csv.DictReader(io.StringIO(content)))
+            for odata in odata_list:
+                odata["targets"] = odata["targets"].split()
+            return odata_list
+
+        odata_list = []
+        for block in content.split("\n\n"):
+            odata = {}
+            for line in block.strip().splitlines():
+                attribute, _, value = line.partition(":")
+                odata[attribute] = value.split() if attribute == "targets" else value
+            if odata:
+                odata_list.append(odata)
+        return odata_list
+
+    def plan_index(self, odata_list, json_index):
         """
-        search substring search in filename and description, secretly sort output by date
+        join the inventory against the index on target ID
+
+        Return one dict per component with the newest package sharing one of
+        its targets, and whether that package is newer than the installed
+        Version, judged by version number when the index has one and by date
+        otherwise; "unknown" when neither can be compared.
         """
-        output_list = []
+        packages_by_target = {}
         for fw in json_index:
-            if searchstring.lower() in fw.lower():
-                output_list.append(
-                    (
-                        json_index[fw]["date"],
-                        fw,
-                        json_index[fw]["description"],
-                        json_index[fw]["target"],
-                        json_index[fw]["deviceclass"],
-                    )
-                )
-            elif searchstring.lower() in json_index[fw]["description"].lower():
-                output_list.append(
-                    (
-                        json_index[fw]["date"],
-                        fw,
-                        json_index[fw]["description"],
-                        json_index[fw]["target"],
-                        json_index[fw]["deviceclass"],
-                    )
-                )
-            elif searchstring.lower() in json_index[fw]["target"]:
-                output_list.append(
-                    (
-                        json_index[fw]["date"],
-                        fw,
-                        json_index[fw]["description"],
-                        json_index[fw]["target"],
-                        json_index[fw]["deviceclass"],
-                    )
-                )
-            elif searchstring.lower() in json_index[fw]["deviceclass"].lower():
-                output_list.append(
-                    (
-                        json_index[fw]["date"],
-                        fw,
-                        json_index[fw]["description"],
-                        json_index[fw]["target"],
-                        json_index[fw]["deviceclass"],
-                    )
-                )
-        output_list_sorted_by_date = sorted(
-            output_list, key=lambda tup: tup[0], reverse=True
-        )
-        for item in output_list_sorted_by_date:
-            print(
-                str(item[1]).ljust(66)
-                + "   "
-                + item[2].encode("ascii", "ignore").decode()
-            )  # unicode, works in python2&3
+            entry = json_index[fw]
+            targets = [entry["target"]] if isinstance(entry["target"], str) else entry["target"]
+            for target in targets:
+                packages_by_target.setdefault(target.lower(), []).append((entry["date"], fw))
+
+        plan = []
+        for odata in odata_list:
+            candidates = []
+            for target in odata.get("targets", []):
+                candidates += packages_by_target.get(target.lower(), [])
+            component = {"Name": odata.get("Name", ""), "Version": odata.get("Version", ""), "package": None}
+            if candidates:
+                date, fw = max(candidates)
+                component.update({"package": fw, "date": date, "update": "unknown"})
+                installed = version_tuple(odata.get("Version", ""))
+                available = version_tuple(json_index[fw].get("version", ""))
+                installed_date = firmware_date(odata.get("Version", ""))
+                available_date = firmware_date(date)
+                if installed and available:
+                    component["update"] = "yes" if available > installed else "no"
+                elif installed_date and available_date:
+                    component["update"] = "yes" if available_date > installed_date else "no"
+            plan.append(component)
+        return plan
+
+    ##########
+    # plan     newest package for every installed component, joined on target ID
+    def plan(self, json_index):
+        plan = self.plan_index(self.load_inventory(), json_index)
+        if self.fwget_options.get("json"):
+            print(json.dumps(plan, indent=4))
+            return 0
+        for component in plan:
+            name = f"{component['Name']} ({component['Version']})".encode("ascii", "ignore").decode()
+            if component["package"] is None:
+                print(name.ljust(50) + "   no package found")
+            else:
+                status = {"yes": "update available", "no": "up to date"}.get(component["update"], "unknown")
+                print(name.ljust(50) + "   " + component["package"].ljust(40) + "   " + component["date"] + "   " + status)
         return 0
 
-    def locate(self, searchstring, json_index, content_url):
+    def serve_query(self, path, query):
         """
-        locate substring search in filename and description, output urls secretly sorted by date
+        answer one API request from this generation of the index; return (status, body)
         """
-        output_list = []
-        for fw in json_index:
-            if searchstring.lower() in fw.lower():
-                output_list.append(
-                    (json_index[fw]["date"], fw, json_index[fw]["description"])
-                )
-            elif searchstring.lower() in json_index[fw]["description"].lower():
-                output_list.append(
-                    (json_index[fw]["date"], fw, json_index[fw]["description"])
-                )
-        output_list_sorted_by_date = sorted(
-            output_list, key=lambda tup: tup[0], reverse=True
-        )
-        for item in output_list_sorted_by_date:
-            print(content_url + "/" + item[1])
+        json_index = self.fwget_json_index
+        keyword = query.get("q", [""])[0]
+        if path in ("/search", "/locate", "/query") and not keyword:
+            return 400, {"error": "missing q parameter"}
+        if path == "/search":
+            return 200, [
+                {"file": fw, "date": date, "description": description, "target": target, "deviceclass": deviceclass}
+                for date, fw, description, target, deviceclass in self.search_index(keyword, json_index)
+            ]
+        if path == "/locate":
+            return 200, [
+                {"file": fw, "date": date, "url": self.package_url(fw, self.content_url)}
+                for date, fw in self.locate_index(keyword, json_index)
+            ]
+        if path == "/query":
+            try:
+                names = self.query_index(FWQuery(keyword), json_index)
+            except ValueError as error:
+                return 400, {"error": f"invalid query: {error}"}
+            return 200, [
+                {
+                    "file": fw, "date": json_index[fw]["date"], "description": json_index[fw]["description"],
+                    "target": json_index[fw]["target"], "deviceclass": json_index[fw]["deviceclass"],
+                }
+                for _, fw in sorted(((json_index[fw]["date"], fw) for fw in names), key=lambda tup: tup[0], reverse=True)
+            ]
+        if path == "/list":
+            return 200, [
+                {"file": fw, "description": json_index[fw]["description"]} for fw in sorted(json_index, reverse=True)
+            ]
+        if path.startswith("/target/"):
+            target = path[len("/target/"):].lower()
+            if not target:
+                return 400, {"error": "missing target ID"}
+            return 200, [
+                {"file": fw, "date": date, "description": description, "deviceclass": deviceclass}
+                for date, fw, description, targets, deviceclass in self.search_index(target, json_index)
+                if target in (t.lower() for t in ([targets] if isinstance(targets, str) else targets))
+            ]
+        return 404, {"error": f"unknown path {path}"}
+
+    def serve_refresh(self, interval):
+        """
+        revalidate the index every interval seconds and publish a new
+        generation when it changed; requests in flight keep the old one,
+        which is closed once the last of them is done
+        """
+        while True:
+            time.sleep(interval)
+            fresh = FWGet(self.fwget_args)
+            fresh.fwget_options, fresh.offline = self.fwget_options, self.offline
+            try:
+                fresh.parse_config()
+            except SystemExit:
+                print("Unable to refresh the firmware index, serving the previous one", file=sys.stderr)
+                fresh.close_index()
+                continue
+            stamp = fresh.index_stamp()
+            if stamp == self.serving_stamp:
+                self.serving_refreshed = time.time()
+                fresh.close_index()
+                continue
+            # Load the search index before any request sees this generation
+            fresh.search_candidates("", fresh.fwget_json_index)
+            with self.serving_lock:
+                previous = self.serving
+                self.serving, self.serving_stamp, self.serving_refreshed = fresh, stamp, time.time()
+                previous.serving_retired = True
+                unused = not previous.serving_users
+            if unused:
+                previous.close_index()
+            print(f"Firmware index updated, {len(fresh.fwget_json_index)} entries", file=sys.stderr)
+
+    def serve_acquire(self):
+        """
+        return the generation answering requests, held until serve_release
+        """
+        with self.serving_lock:
+            generation = self.serving
+            generation.serving_users += 1
+        return generation
+
+    def serve_release(self, generation):
+        with self.serving_lock:
+            generation.serving_users -= 1
+            unused = generation.serving_retired and not generation.serving_users
+        if unused:
+            generation.close_index()
+
+    def close_index(self):
+        """
+        release the memory maps and connections of this generation
+        """
+        for resource in (self.fwget_json_index, self.search_postings, self.session):
+            if hasattr(resource, "close"):
+                resource.close()
+
+    def serve(self):
+        """
+        answer search, locate, list and target lookups over a local HTTP JSON API
+
+        The index is loaded once and kept in memory; a background thread
+        revalidates it and swaps in a new generation, each complete with its
+        search index, so concurrent requests never see a half-updated one.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import parse_qs, unquote, urlsplit
+
+        listen = self.fwget_options.get("listen", "127.0.0.1:8080")
+        refresh = self.fwget_options.get("refresh", 900)
+        try:
+            host, _, port = listen.rpartition(":")
+            port = int(port)
+            interval = float(refresh)
+        except ValueError:
+            print("Error: --listen takes <host>:<port> and --refresh a number of seconds")
+            sys.exit(1)
+
+        self.search_candidates("", self.fwget_json_index)
+        self.serving, self.serving_stamp = self, self.index_stamp()
+        self.serving_started = self.serving_refreshed = time.time()
+        fwget = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                if not fwget.fwget_options.get("quiet"):
+                    super().log_message(format, *args)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                path = unquote(url.path).rstrip("/") or "/"
+                generation = fwget.serve_acquire()
+                try:
+                    if path == "/status":
+                        status, body = 200, {
+                            "entries": len(generation.fwget_json_index),
+                            "repositories": generation.sdr_urls,
+                            "started": fwget.serving_started,
+                            "refreshed": fwget.serving_refreshed,
+                            "refresh_interval": interval,
+                        }
+                    else:
+                        status, body = generation.serve_query(path, parse_qs(url.query))
+                except Exception as e:
+                    status, body = 500, {"error": str(e)}
+                finally:
+                    fwget.serve_release(generation)
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((host or "127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=self.serve_refresh, args=(interval,), daemon=True).start()
+        print(f"Serving {len(self.fwget_json_index)} firmware entries on http://{host or '127.0.0.1'}:{port}/", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
         return 0
 
     ##########
-    # download download file supplied on command name, no wildcards
-    def download(self, file, content_url):
-        url = content_url + "/" + file
-        print(f"download {file} ...")
+    # cache-serve  site cache of the repositories, for the fwget clients of a LAN
+    def cache_upstream(self, path):
+        """
+        return (sdr_url, upstream URL) for a request path, or None when no repository serves it
+
+        Each repository is served under the path of its sdr_url, so a client
+        only replaces the scheme and host of its sdr_url with the cache's; a
+        single repository is also served from the root.
+        """
+        from urllib.parse import urlsplit
+
+        if ".." in path.split("/"):
+            return None
+        for sdr_url in self.sdr_urls:
+            prefix = urlsplit(sdr_url).path.rstrip("/")
+            if prefix and path.startswith(prefix + "/"):
+                return sdr_url, self.repos[sdr_url][1] + path[len(prefix):]
+        if len(self.sdr_urls) == 1:
+            return self.sdr_url, self.content_url + path
+        return None
+
+    def cache_fetch(self, upstream, object_file, meta_file, meta, fill=None):
+        """
+        fetch upstream into object_file, revalidating the copy described by meta; return the new meta
+
+        While a body of known length downloads, fill (a dict guarded by the
+        Condition fill["cond"]) holds its "meta", "size", the "file" holding
+        it and the bytes "written" so far, so it can be served as it arrives.
+        Raises Exception(status) when the repository answers anything but 200 or 304.
+        """
+        fill = {"cond": threading.Condition()} if fill is None else fill
+        headers = {}
+        if meta and os.path.isfile(object_file):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        tmp_file = tmp_name(object_file)
+        try:
+            with self.http_session().get(upstream, headers=headers, stream=True) as response:
+                if response.status_code == 304 and headers:
+                    meta = dict(meta, fetched=time.time())
+                elif response.status_code == 200:
+                    meta = {
+                        "etag": response.headers.get("ETag", ""),
+                        "last_modified": response.headers.get("Last-Modified", ""),
+                        "content_type": response.headers.get("Content-Type", "application/octet-stream"),
+                        "fetched": time.time(),
+                    }
+                    # Only a body stored as sent has a length known in advance
+                    length = response.headers.get("Content-Length", "")
+                    identity = response.headers.get("Content-Encoding", "identity") == "identity"
+                    size = int(length) if length.isdigit() and identity else None
+                    with TIMINGS.span("transfer", file=os.path.basename(upstream)) as span:
+                        with open(tmp_file, "wb") as f, BANDWIDTH.transfer(self.download_priority) as throttle:
+                            with fill["cond"]:
+                                fill.update(meta=meta, size=size, file=tmp_file, written=0)
+                                fill["cond"].notify_all()
+                            for chunk in response.iter_content(BANDWIDTH.chunk_size()):
+                                f.write(chunk)
+                                f.flush()
+                                throttle(len(chunk))
+                                with fill["cond"]:
+                                    fill["written"] += len(chunk)
+                                    fill["cond"].notify_all()
+                        span["bytes"] = fill["written"]
+                    TIMINGS.count("bytes.downloaded", span["bytes"])
+                    if size is not None and fill["written"] != size:
+                        raise Exception(502)
+                    with fill["cond"]:
+                        os.replace(tmp_file, object_file)
+                        fill["file"] = object_file
+                else:
+                    raise Exception(response.status_code)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_file)
+            raise
+        with atomic_file(meta_file) as f:
+            json.dump(meta, f)
+        return meta
+
+    def cache_serve(self):
+        """
+        serve the repositories from a local cache, so a site fetches every package only once
+
+        A path not yet cached is fetched from its repository on first
+        request, and that request and any concurrent ones for the same path
+        are answered from the growing file as the single fetch downloads it,
+        so large packages start flowing at once.  Packages are then answered from disk
+        with sendfile, honouring Range and If-None-Match, and the least
+        recently used ones are evicted once the cache exceeds --max-size MB.
+        The index under fwrepodata/ is revalidated once older than --refresh
+        seconds.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import unquote, urlsplit
+
+        options = self.fwget_options
+        listen = options.get("listen", "0.0.0.0:8081")
+        refresh = options.get("refresh", 300)
+        max_size = options.get("max-size", self.package_cache_max_size)
+        cache_dir = options.get("cache-dir", os.path.join("~", ".cache", "fwget-serve"))
         try:
-            html_request = requests.get(url, timeout=30)
-            if html_request.status_code != 200:
-                raise Exception(html_request.status_code)
+            host, _, port = listen.rpartition(":")
+            port = int(port)
+            interval = float(refresh)
+            max_size = float(max_size)
+        except ValueError:
+            print("Error: --listen takes <host>:<port>, --refresh a number of seconds and --max-size a number of MB")
+            sys.exit(1)
+        cache_dir = os.path.expanduser(cache_dir)
+        objects_dir = os.path.join(cache_dir, "objects")
+        meta_dir = os.path.join(cache_dir, "meta")
+        os.makedirs(objects_dir, exist_ok=True)
+        os.makedirs(meta_dir, exist_ok=True)
+        # Partial objects left by a previous run that was killed
+        for item in os.scandir(objects_dir):
+            if item.name.endswith(".tmp"):
+                with contextlib.suppress(OSError):
+                    os.remove(item.path)
+        fetches = {}  # cache key -> fill dict of the fetch in progress, see cache_fetch
+        fetches_lock = threading.Lock()
+        evict_lock = threading.Lock()
+        fwget = self
 
-            with open(file, "wb") as firmware_file:
-                firmware_file.write(html_request.content)
-        except Exception as error:
-            if str(error) == "404":
-                print("Unable to download firmware (404 not found):")
-                print("   " + url)
-                sys.exit(1)
-            elif str(error) == "401":
-                print("""
-                    Unable to download firmware (401 not authorized)
-                    A valid warranty or support contract is required to access HPE firmware."
-                    Please visit http://downloads.linux.hpe.com/SDR/project/fwpp/ to "
-                    generate an access token then add it to ~/.fwget.conf.
-                """)
-                sys.exit(1)
-            else:
-                print("Unable to download.")
-                print(str(error))
-                sys.exit(1)
+        def fetch(key, upstream, object_file, meta_file, meta, fill):
+            try:
+                meta = fwget.cache_fetch(upstream, object_file, meta_file, meta, fill)
+            except Exception as e:
+                fill["error"] = e
+            finally:
+                with fetches_lock:
+                    del fetches[key]
+                with fill["cond"]:
+                    fill["meta"] = meta
+                    fill["done"] = True
+                    fill["cond"].notify_all()
+            if not fill["error"]:
+                with evict_lock:
+                    # The object just fetched stays, even when larger than --max-size
+                    fwget.cache_evict(objects_dir, max_size, keep=object_file)
 
-        # Download the decoupled JSON file corresponding to fwpkg, introduced starting from Gen12 SPP
-        if file.endswith(".fwpkg") and not any(re.search(gen, url) for gen in gen_for_old_fwpkg):
-            json_file = file.replace('.fwpkg', '.json')
-            url = content_url + "/" + json_file
+        def cached(path):
+            """
+            bring the cached copy of path up to date; return (open object file, meta, fill) or raise Exception(status)
+
+            fill is the state of the fetch still downloading the object, or None once it is complete.
+            """
+            target = fwget.cache_upstream(path)
+            if target is None:
+                raise Exception(404)
+            sdr_url, upstream = target
+            key = hashlib.sha256(f"{sdr_url}|{path}".encode("utf-8")).hexdigest()
+            object_file, meta_file = os.path.join(objects_dir, key), os.path.join(meta_dir, key + ".json")
             try:
-                html_request = requests.get(url, timeout=30)
-                if html_request.status_code != 200:
-                    raise Exception(html_request.status_code)
-
-                print(f"download {json_file} ...")
-                with open(json_file, 'wb') as json_file:
-                    json_file.write(html_request.content)
-            except Exception as error:
-                if str(error) == '404':
-                    sys.exit(1)
-                elif str(error) == '401':
-                    print("Unable to download JSON file (401 not authorized).")
-                    sys.exit(1)
+                with open(meta_file, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = None
+            mutable = "/fwrepodata/" in path
+            if meta and not (mutable and time.time() - meta["fetched"] >= interval):
+                try:
+                    # Opened here, so an eviction from now on cannot take it away from this request
+                    data = open(object_file, "rb")
+                except FileNotFoundError:
+                    pass  # evicted meanwhile, fetch it again
                 else:
-                    print("Unable to download.")
-                    print(str(error))
-                    sys.exit(1)
+                    TIMINGS.count("cache.hit", 1)
+                    # Most recently used; harmless when the file was evicted or cannot be touched
+                    with contextlib.suppress(OSError):
+                        os.utime(object_file)
+                    return data, meta, None
 
-        return 0
+            with fetches_lock:
+                fill = fetches.get(key)
+                if fill is None:
+                    TIMINGS.count("cache.miss", 1)
+                    fill = fetches[key] = {"cond": threading.Condition(), "size": None, "done": False, "error": None}
+                    threading.Thread(
+                        target=fetch, args=(key, upstream, object_file, meta_file, meta, fill), daemon=True
+                    ).start()
+                else:
+                    TIMINGS.count("cache.coalesced", 1)
+            with fill["cond"]:
+                # A body of known length is served as it arrives, anything else once complete
+                fill["cond"].wait_for(lambda: fill["done"] or fill["size"] is not None)
+                if fill["error"]:
+                    raise fill["error"]
+                try:
+                    data = open(fill.get("file", object_file), "rb")
+                except FileNotFoundError:
+                    raise Exception(502)
+                return data, fill["meta"], None if fill["done"] else fill
 
-    ##########
-    # list     everything, sorted by filename
-    def list(self, json_index):
-        output_list = []
-        for fw in json_index:
-            # print (fw.ljust(33) + " " +  json_index[fw]["description"])
-            output_list.append((fw, json_index[fw]["description"]))
-        output_list_sorted_by_filename = sorted(
-            output_list, key=lambda tup: tup[0], reverse=True
-        )
-        for item in output_list_sorted_by_filename:
-            # print (item[0].encode('ascii','ignore').ljust(33).decode() + "   " + item[1].encode('ascii','ignore').decode() ) # unicode, works in python2&3
-            print(
-                str(item[0]).ljust(33)
-                + "   "
-                + item[1].encode("ascii", "ignore").decode()
-            )  # unicode, works in python2&3
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                if not options.get("quiet"):
+                    super().log_message(format, *args)
+
+            def error(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_HEAD(self):
+                self.do_GET(body=False)
+
+            def do_GET(self, body=True):
+                path = unquote(urlsplit(self.path).path)
+                try:
+                    data, meta, fill = cached(path)
+                except Exception as e:
+                    status = e.args[0] if e.args and isinstance(e.args[0], int) else 502
+                    return self.error(404 if status == 404 else 502)
+                with data:
+                    size = fill["size"] if fill else os.fstat(data.fileno()).st_size
+                    etag = meta.get("etag", "")
+                    if etag and self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    start, end = 0, size - 1
+                    ranged = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").strip())
+                    if ranged and (ranged.group(1) or ranged.group(2)):
+                        if ranged.group(1):
+                            start = int(ranged.group(1))
+                            end = min(int(ranged.group(2)), size - 1) if ranged.group(2) else size - 1
+                        else:
+                            start = max(0, size - int(ranged.group(2)))
+                        if start > end:
+                            self.send_response(416)
+                            self.send_header("Content-Range", f"bytes */{size}")
+                            self.send_header("Content-Length", "0")
+                            self.end_headers()
+                            return
+                        self.send_response(206)
+                        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                    else:
+                        self.send_response(200)
+                    self.send_header("Content-Type", meta.get("content_type") or "application/octet-stream")
+                    self.send_header("Content-Length", str(end + 1 - start))
+                    self.send_header("Accept-Ranges", "bytes")
+                    if etag:
+                        self.send_header("ETag", etag)
+                    if meta.get("last_modified"):
+                        self.send_header("Last-Modified", meta["last_modified"])
+                    self.end_headers()
+                    if body and end >= start and fill:
+                        self.send_growing(data, fill, start, end)
+                    elif body and end >= start:
+                        # Zero-copy from the page cache to the socket where the platform allows it
+                        self.connection.sendfile(data, start, end + 1 - start)
+                        TIMINGS.count("bytes.served", end + 1 - start)
+
+            def send_growing(self, data, fill, start, end):
+                """
+                send bytes start to end of an object still downloading, as they are written
+                """
+                position = start
+                while position <= end:
+                    with fill["cond"]:
+                        fill["cond"].wait_for(lambda: fill["written"] > position or fill["done"])
+                        available = min(fill["written"], end + 1)
+                    if available <= position:
+                        # The fetch failed: closing the connection short of Content-Length tells the client
+                        self.close_connection = True
+                        return
+                    self.connection.sendfile(data, position, available - position)
+                    TIMINGS.count("bytes.served", available - position)
+                    position = available
+
+        server = ThreadingHTTPServer((host or "0.0.0.0", port), Handler)
+        server.daemon_threads = True
+        for sdr_url in self.sdr_urls:
+            prefix = urlsplit(sdr_url).path.rstrip("/") or "/"
+            print(f"Caching {sdr_url} as http://{host or '0.0.0.0'}:{port}{prefix} in {cache_dir}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
         return 0
 
     def help_menu(self):
@@ -388,8 +3352,19 @@ class FWGet(Configuration):
         Usage:
           fwget locate <keyword>      # Locate correspodant URL of the given firmware package. (e.g., locate U30_2.10_05_21_2019.fwpkg)
           fwget search <keyword>      # Search firmware for server models.                     (e.g., search dl379)
-          fwget download <keyword>    # Download firmware based on search result.              (e.g., download U30_2.10_05_21_2019.fwpkg)
+          fwget download <keyword>... # Download firmware based on search result.              (e.g., download U30_2.10_05_21_2019.fwpkg)
+          fwget download --search <keyword>  # Download every firmware matching the search.   (e.g., download --search dl380)
+          fwget download --file <path>       # Download the firmware listed in a file, or - for stdin, one "<name> [priority]" per line.
+          fwget search --file <path>  # Search every keyword listed in a file, or - for stdin, printing NDJSON.
+          fwget locate --file <path>  # Locate every keyword listed in a file, or - for stdin, printing NDJSON.
           fwget list                  # List all firmwares on HPE SDR.                         (e.g., list)
+          fwget query <query>         # Search with fields, and/or/not, regex and dates. (e.g., query 'deviceclass=SystemROM and date>=2024-01-01 and dl380')
+          fwget plan [--live] [--json]  # Newest firmware for each component listed by fwlist.
+          fwget sync <directory>      # Mirror the repository, or the packages matching the filters below.
+          fwget verify [<file>...]    # Check downloaded files against the checksum and size of the index.
+          fwget serve                 # Answer queries over a local HTTP JSON API from an index kept in memory.
+          fwget cache-serve           # Serve the repositories to the LAN from a local cache; clients point sdr_url at it.
+          fwget changes               # Packages added, removed, changed or superseded by the last index refresh.
 
         Arguments:
           <keyword>                   # Required for locate, search, and download commands
@@ -397,25 +3372,98 @@ class FWGet(Configuration):
         Options:
           -h, --help                  # Show this help message and exit
           -v, --version               # print the fwget version number and exit
+          --offline                   # Use the cached firmware index only, without network access
+          --workers <n>               # Number of concurrent downloads (default: download_workers, 4)
+          --segments <n>              # Fetch each large file as n byte ranges at once (default: download_segments, 1)
+          --limit-rate <rate>         # Cap the total download rate, e.g. 500K or 10M per second (default: download_rate_limit)
+          --priority <n>              # Share of the capped rate for this run's downloads (default: 1)
+          --ndjson                    # search, locate, query: print one JSON object per match
+          --limit <n>                 # search, locate, list, query: print at most n results
+          --offset <n>                # search, locate, list, query: skip the first n results
+          --sort date|name            # search, locate, list, query: newest first, or by filename
+          --newest-per-target         # search, locate, list, query: only the newest package of each target
+          --live                      # plan: read the inventory from the iLO instead of ~/.fwlist.output
+          --json                      # plan, changes: print JSON
+          --deviceclass <class>       # sync, changes: only packages of this device class
+          --target <id>               # sync, changes: only packages for this target ID
+          --since <date>, --until <date>  # sync: only packages dated within this range (YYYY-MM-DD)
+                                      # changes: every refresh since this date
+          --search <keyword>          # sync: only packages matching the search
+          --latest                    # sync: only the newest package of each target
+          --prune                     # sync: delete mirrored packages that are no longer selected
+          --link-dest <dir>[,<dir>]   # sync: hardlink packages already mirrored in these directories
+          --listen <host>:<port>      # serve: address to listen on (default: 127.0.0.1:8080, cache-serve: 0.0.0.0:8081)
+          --refresh <seconds>         # serve: how often the index is revalidated (default: 900, cache-serve: 300)
+          --quiet                     # serve, cache-serve: do not log requests
+          --cache-dir <dir>           # cache-serve: where to keep the cached files (default: ~/.cache/fwget-serve)
+          --max-size <MB>             # cache-serve: evict the least recently used files above this size (default: package_cache_max_size)
+          --timings[=<file>]          # Report the time spent in each phase as JSON, to stderr or <file>
+          --profile <file>            # Write cProfile statistics of the run to <file>
+
+        Environment:
+          FWGET_TIMINGS=1|<file>      # Same as --timings
+          FWGET_PROFILE=<file>        # Same as --profile
         """
         print(msg)
 
     def operation_handler(self):
-        if self.fwget_operation == "search" and self.fwget_keyword:
+        if self.fwget_operation in ("search", "locate") and self.fwget_options.get("file"):
+            terms = self.list_lines(self.fwget_options["file"], "query list")
+            self.batch(self.fwget_operation, terms, self.fwget_json_index)
+        elif self.fwget_operation in ("search", "locate") and self.fwget_keyword and self.fwget_options.get("ndjson"):
+            self.batch(self.fwget_operation, [self.fwget_keyword], self.fwget_json_index)
+        elif self.fwget_operation == "search" and self.fwget_keyword:
             self.search(self.fwget_keyword, self.fwget_json_index)
+        elif self.fwget_operation == "query" and self.fwget_keyword:
+            self.query(" ".join(self.fwget_args[2:]), self.fwget_json_index)
         elif self.fwget_operation == "locate" and self.fwget_keyword:
             self.locate(self.fwget_keyword, self.fwget_json_index, self.content_url)
-        elif self.fwget_operation == "download" and self.fwget_keyword:
-            self.download(self.fwget_keyword, self.content_url)
+        elif self.fwget_operation == "download" and (
+            self.fwget_keyword or self.fwget_options.get("file") or self.fwget_options.get("search")
+        ):
+            self.download(self.download_names(self.fwget_json_index), self.content_url)
         elif self.fwget_operation == "list":
             self.list(self.fwget_json_index)
+        elif self.fwget_operation == "plan":
+            self.plan(self.fwget_json_index)
+        elif self.fwget_operation == "verify":
+            self.verify(self.fwget_args[2:], self.fwget_json_index)
+        elif self.fwget_operation == "sync" and self.fwget_keyword:
+            self.sync(self.fwget_keyword, self.fwget_json_index, self.content_url)
+        elif self.fwget_operation == "serve":
+            self.serve()
+        elif self.fwget_operation == "cache-serve":
+            self.cache_serve()
+        elif self.fwget_operation == "changes":
+            self.changes()
         else:
             raise KeyError(f"{self.fwget_operation} operation is incorrect! Please use -h or --help for more usage")
 
 class FWList(Configuration):
+    # Serializes updates of ~/.fwlist.session and ~/.fwlist.inventory between fleet threads
+    session_file_lock = threading.Lock()
+    inventory_file_lock = threading.Lock()
+    # Returned by redfish_get when a conditional request finds the resource unchanged
+    NOT_MODIFIED = object()
+
     def __init__(self, args):
         Configuration.__init__(self)
+        self.fwlist_args, self.fwlist_options = split_options(
+            args, ("fleet", "concurrency", "timeout", "output-dir", "profile", "output")
+        )
+        args = self.fwlist_args
         self.fwlist_odataid_output_format = "spaced_display" if len(args) < 2 else args[1]
+        self.ilo_scheme = "https"  # iLOs only serve Redfish over https; plain http is for test doubles
+        self.session_file = os.path.expanduser("~") + "/.fwlist.session"  # cached Redfish sessions
+        self.inventory_file = os.path.expanduser("~") + "/.fwlist.inventory"  # previous inventories and ETags
+        self.inventory_changes = None  # changes since the previous inventory, set by firmware_parse
+        self.inventories = None  # in fleet mode, the inventories of every iLO, written once by fleet_export
+        self.sessions = None  # in fleet mode, the cached sessions of every iLO, written once by fleet_export
+        self.machine_output = bool(self.fwlist_options.get("diff")) or self.fwlist_odataid_output_format in ("ndjson", "csv")
+        self.session_url = None
+        self.relogin_lock = threading.Lock()
+        self.fleet_concurrency = 32
+        self.fleet_timeout = 30
         #print(len(args),args,args[1])
         self.odataid_file = os.path.expanduser("~") + "/.fwlist.output"  # where to store odataid in json format
         self.firmware_inventory_url = "/redfish/v1/UpdateService/FirmwareInventory/"
@@ -430,55 +3478,193 @@ class FWList(Configuration):
         Arguments:
           spaced_display              # Export date in spaced format (used by default if no argument is provided)
           json_display                # Export data in json format
+          ndjson                      # Export one JSON object per component and line
+          csv                         # Export data as CSV: @odata.id,Name,Version,Description,targets
 
         Options:
           -h, --help                  # Show this help message and exit
           -v, --version               # print the fwget version number and exit
+          --fleet <file>              # Inventory every iLO listed in <file>, streaming NDJSON to stdout
+          --concurrency <n>           # Number of iLOs inventoried at once in fleet mode (default: 32)
+          --timeout <seconds>         # Time allowed for each iLO in fleet mode, retries included (default: 30)
+          --output-dir <dir>          # Write one <ilo_address>.json per iLO instead of NDJSON to stdout
+          --output <file>             # Export to <file> instead of ~/.fwlist.output; "-" for stdout only
+          --diff                      # Print the changes since the previous run as JSON instead of the inventory
+          --timings[=<file>]          # Report the time spent in each phase as JSON, to stderr or <file>
+          --profile <file>            # Write cProfile statistics of the run to <file>
+
+        Fleet file:
+          A JSON list of objects with "ilo_address" and optionally "ilo_username",
+          "ilo_password" and "ilo_proxy", or one "<ilo_address> [<username> <password>]"
+          per line.  Missing credentials default to those of ~/.fwget.conf.
         """
         print(msg)
 
+    def redfish_session(self):
+        """
+        create the Transport for Redfish API communication
+        """
+        # One keep-alive connection per concurrent FirmwareInventory request
+        session = self.transport(self.redfish_workers)
+        session.verify = False  # Not for production use
+        return session
+
     def redfish_login(self, session):
 
-        login_url = f"https://{self.ilo_address}/redfish/v1/SessionService/Sessions"
+        login_url = f"{self.ilo_scheme}://{self.ilo_address}/redfish/v1/SessionService/Sessions"
         payload = {"UserName": self.username, "Password": self.password}
 
+        self.redfish_proxy(session)
+        with TIMINGS.span("redfish.login", host=self.ilo_address) as span:
+            response = session.post(login_url, json=payload)
+            span["status"] = response.status_code
+
+        if response.status_code != 201:
+            print("Login failed:", response.status_code, file=sys.stderr)
+            print(response.text, file=sys.stderr)
+            return None, None
+
+        token = response.headers.get("X-Auth-Token")
+        session_url = response.headers.get("Location")
+        session.headers.update({"X-Auth-Token": token})
+        return token, session_url
+
+    def redfish_proxy(self, session):
         # Use environment proxy settings if ilo_proxy is set to yes.
         if str(self.ilo_proxy).lower() != "yes":
             session.trust_env = False
         else:
             session.trust_env = True
             # Proxy settings from the current environment
+            from urllib.request import getproxies
+
             proxies = getproxies()
             if proxies:
-                print("Environment proxies:\n", proxies, "\n")
+                print("Environment proxies:\n", proxies, "\n", file=sys.stderr)
             else:
-                print("ilo_proxy:", proxies, "(No proxy founded in the current environment).\n")
+                print("ilo_proxy:", proxies, "(No proxy founded in the current environment).\n", file=sys.stderr)
 
-        response = session.post(login_url, json=payload)
+    def session_key(self):
+        return f"{self.username}@{self.ilo_address}"
 
-        if response.status_code != 201:
-            print("Login failed:", response.status_code, file=sys.stderr)
-            print(response.text, file=sys.stderr)
-            return None, None
+    def load_sessions(self):
+        if self.sessions is not None:
+            return self.sessions
+        try:
+            with open(self.session_file, "r", encoding="utf-8") as f:
+                sessions = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return sessions if isinstance(sessions, dict) else {}
 
-        token = response.headers.get("X-Auth-Token")
-        session_url = response.headers.get("Location")
-        session.headers.update({"X-Auth-Token": token})
-        return token, session_url
+    def save_session(self, token, session_url):
+        """
+        record the session of this iLO in ~/.fwlist.session, readable by its owner only
+        """
+        session = {"token": token, "location": session_url, "last_used": time.time()}
+        with FWList.session_file_lock:
+            if self.sessions is not None:
+                # Fleet mode: kept in memory until every iLO is done
+                self.sessions[self.session_key()] = session
+                return
+            sessions = self.load_sessions()
+            sessions[self.session_key()] = session
+            self.write_sessions(sessions)
+
+    def write_sessions(self, sessions):
+        """
+        write the sessions still within session_idle_timeout to ~/.fwlist.session, readable by its owner only
+        """
+        now = time.time()
+        sessions = {
+            key: cached for key, cached in sessions.items() if now - cached.get("last_used", 0) < self.session_idle_timeout
+        }
+        try:
+            # Readable by its owner only from the start
+            with atomic_file(self.session_file, opener=lambda path, flags: os.open(path, flags, 0o600)) as f:
+                os.fchmod(f.fileno(), 0o600)
+                json.dump(sessions, f)
+        except OSError as e:
+            print(f"Unable to write session cache {self.session_file}: {e}", file=sys.stderr)
+
+    def redfish_connect(self, session):
+        """
+        log in to the iLO, reusing the cached session when session_cache is enabled
+
+        A cached session is only reused while it has been idle for less than
+        session_idle_timeout and a GET of its session resource succeeds.
+        """
+        if str(self.session_cache).lower() == "yes":
+            cached = self.load_sessions().get(self.session_key())
+            if cached and time.time() - cached.get("last_used", 0) < self.session_idle_timeout:
+                self.redfish_proxy(session)
+                session.headers.update({"X-Auth-Token": cached["token"]})
+                with TIMINGS.span("redfish.resume", host=self.ilo_address) as span:
+                    response = session.get(cached["location"])
+                    span["status"] = response.status_code
+                if response.status_code == 200:
+                    self.session_url = cached["location"]
+                    return cached["token"], cached["location"]
+                del session.headers["X-Auth-Token"]
+
+        token, self.session_url = self.redfish_login(session)
+        return token, self.session_url
+
+    def redfish_relogin(self, session, stale_token):
+        """
+        replace a session the iLO rejected with 401; concurrent callers share one login
+        """
+        with self.relogin_lock:
+            if session.headers.get("X-Auth-Token") != stale_token:
+                return True
+            token, session_url = self.redfish_login(session)
+            if token:
+                self.session_url = session_url
+            return bool(token)
+
+    def redfish_disconnect(self, session):
+        """
+        keep the session for the next run when session_cache is enabled, otherwise log out
+        """
+        if str(self.session_cache).lower() == "yes" and self.session_url:
+            self.save_session(session.headers["X-Auth-Token"], self.session_url)
+        else:
+            self.redfish_logout(session, self.session_url)
+
+    def redfish_get(self, session, path, report_errors=True, etag=None):
+        """
+        GET path and return its JSON, or None on error
 
-    def redfish_get(self, session, path):
+        With etag the request is conditional, and NOT_MODIFIED is returned
+        when the iLO answers 304.  An ETag header the body lacks is copied
+        into it as "@odata.etag".
+        """
         ilo_url = self.ilo_address
         result = {}
 
-        full_url = "https://" + ilo_url + path
-        response = session.get(full_url)
-        if response.status_code == 200:
-            if DEBUG:
-                print("Success:")
-                print(response.json())
+        full_url = self.ilo_scheme + "://" + ilo_url + path
+        token = session.headers.get("X-Auth-Token")
+        headers = {"If-None-Match": etag} if etag else None
+        with TIMINGS.span("redfish.get", host=ilo_url, path=path) as span:
+            response = session.get(full_url, headers=headers)
+            if (
+                response.status_code == 401
+                and str(self.session_cache).lower() == "yes"
+                and self.redfish_relogin(session, token)
+            ):
+                response = session.get(full_url, headers=headers)
+            span["status"] = response.status_code
+            span["bytes"] = len(response.content)
+        TIMINGS.count("bytes.redfish", len(response.content))
+        if response.status_code == 304 and etag:
+            result = FWList.NOT_MODIFIED
+        elif response.status_code == 200:
             result = response.json()
+            if isinstance(result, dict) and response.headers.get("ETag"):
+                result.setdefault("@odata.etag", response.headers["ETag"])
         else:
-            print(f"Failed to get {path}: {response.status_code}", file=sys.stderr)
+            if report_errors:
+                print(f"Failed to get {path}: {response.status_code}", file=sys.stderr)
             result = None
         return result
 
@@ -486,19 +3672,23 @@ class FWList(Configuration):
         if not session_url:
             return
         try:
-            response = session.delete(session_url, headers={"X-Auth-Token": session.headers["X-Auth-Token"]})
+            with TIMINGS.span("redfish.logout", host=self.ilo_address):
+                response = session.delete(session_url, headers={"X-Auth-Token": session.headers["X-Auth-Token"]})
             if response.status_code not in (200, 204):
                 print(f"Logout failed: {response.status_code}", file=sys.stderr)
-
-            if DEBUG:
-                print("\n------------- Redfish Logout successfully -----------------\n")
         except Exception as e:
             print("Logout error:", e, file=sys.stderr)
 
-    def odata_parse(self, odata_id_list: list, session) -> None:
+    def odata_parse(self, odata_id_list: list, session, cached_members=None, etags=None, emit=None) -> list:
         """
         parse odata based on odataid url
 
+        Members found in cached_members, the previous inventory of this iLO,
+        are requested with If-None-Match and kept as they were when the iLO
+        answers 304.  The ETag of every member is stored in etags.  emit, when
+        given, is called with each record as soon as it and those before it
+        have been fetched.
+
         [{'@odata.id': '/redfish/v1/UpdateService/FirmwareInventory/1/',
           'Description': 'SystemBMC',
           'Name': 'iLO 5',
@@ -511,10 +3701,35 @@ class FWList(Configuration):
           'Version': 'UE5100RL',
           'targets': ['532340a5-6e61-6944-736b-20534a87fef4']}]
         """
-        odata_list = []
+        cached_members = cached_members or {}
+        etags = {} if etags is None else etags
+
+        def fetch(odataid):
+            cached = cached_members.get(odataid, {})
+            fw_info = self.redfish_get(session, odataid, etag=cached.get("etag"))
+            if fw_info is FWList.NOT_MODIFIED:
+                TIMINGS.count("redfish.not_modified", 1)
+                etags[odataid] = cached["etag"]
+                return cached["record"]
+            if isinstance(fw_info, dict):
+                etags[odataid] = fw_info.get("@odata.etag", "")
+            return self.odata_records([fw_info])[0]
 
-        fw_info_list = [self.redfish_get(session, odataid) for odataid in odata_id_list]
+        # Fetch members concurrently; map() keeps the inventory order
+        workers = max(1, min(self.redfish_workers, len(odata_id_list)))
+        odata_list = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for odata in executor.map(fetch, odata_id_list):
+                if emit:
+                    emit(odata)
+                odata_list.append(odata)
+        return odata_list
 
+    def odata_records(self, fw_info_list: list) -> list:
+        """
+        reduce FirmwareInventory members to the attributes fwlist exports
+        """
+        odata_list = []
         for fw_info in fw_info_list:
             try:
                 odata = {}
@@ -530,66 +3745,336 @@ class FWList(Configuration):
                 sys.exit(1)
         return odata_list
 
-    def firmware_parse(self, session, session_url):
+    def firmware_parse(self, session, session_url, emit=None):
         """
-        parse firmware via iLO restful API and output in a odataid list
+        parse firmware via iLO restful API and output in a odataid list,
+        passing each record to emit as soon as it is parsed
         """
-        ret = json.dumps(self.redfish_get(session, self.firmware_inventory_url))
+        with TIMINGS.span("inventory", host=self.ilo_address) as span:
+            use_cache = str(self.inventory_cache).lower() == "yes"
+            previous = self.load_inventories().get(self.ilo_address) if use_cache else None
+            cached_members = previous.get("members", {}) if previous else {}
+            etags = {}
+            odata_list = None
+            expand = previous.get("expand", True) if previous else True
+
+            # iLOs supporting $expand return every member in a single round trip,
+            # with the ETags to compare against the cache; the others are read
+            # member by member, with If-None-Match once their ETags are known
+            if expand:
+                expanded = self.redfish_get(session, self.firmware_inventory_url + "?$expand=.", report_errors=False)
+                members = expanded.get("Members") if isinstance(expanded, dict) else None
+                expand = bool(members) and all("Version" in member for member in members)
+            if expand:
+                span["expand"] = True
+                odata_list = []
+                unchanged = 0
+                for odata, member in zip(self.odata_records(members), members):
+                    etags[odata["@odata.id"]] = etag = member.get("@odata.etag", "")
+                    cached = cached_members.get(odata["@odata.id"])
+                    if etag and cached and cached.get("etag") == etag:
+                        odata = cached["record"]
+                        unchanged += 1
+                    odata_list.append(odata)
+                    if emit:
+                        emit(odata)
+                span["unchanged"] = unchanged
+
+            if odata_list is None:
+                # The collection is always read: its ETag need not change when a member's version does
+                ret = json.dumps(self.redfish_get(session, self.firmware_inventory_url))
 
+                try:
+                    fw_list = json.loads(ret)
+                except Exception as e:
+                    print(f"firmware parse error: {e}", file=sys.stderr)
+                    self.redfish_logout(session, session_url)
+                    sys.exit(1)
+
+                odata_id_list = [odataid["@odata.id"] for odataid in fw_list["Members"]]
+                odata_list = self.odata_parse(odata_id_list, session, cached_members, etags, emit)
+                span["expand"] = False
+
+            if use_cache:
+                if previous:
+                    self.inventory_changes = self.inventory_diff(previous, odata_list)
+                self.save_inventory(odata_list, etags, expand)
+            return odata_list
+
+    def load_inventories(self):
+        if self.inventories is not None:
+            return self.inventories
         try:
-            fw_list = json.loads(ret)
-        except Exception as e:
-            print(f"firmware parse error: {e}", file=sys.stderr)
-            self.redfish_logout(session, session_url)
+            with open(self.inventory_file, "r", encoding="utf-8") as f:
+                inventories = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return inventories if isinstance(inventories, dict) else {}
+
+    def save_inventory(self, odata_list, etags, expand):
+        """
+        record the inventory of this iLO, with the ETag of every member and
+        whether it supports $expand, in ~/.fwlist.inventory
+        """
+        inventory = {
+            "updated": time.time(),
+            "expand": expand,
+            "members": {
+                odata["@odata.id"]: {"etag": etags.get(odata["@odata.id"], ""), "record": odata}
+                for odata in odata_list
+            },
+        }
+        if self.inventories is not None:
+            # Fleet mode: kept in memory until every iLO is done
+            self.inventories[self.ilo_address] = inventory
+            return
+        with FWList.inventory_file_lock:
+            inventories = self.load_inventories()
+            inventories[self.ilo_address] = inventory
+            self.write_inventories(inventories)
+
+    def write_inventories(self, inventories):
+        try:
+            with atomic_file(self.inventory_file) as f:
+                json.dump(inventories, f)
+        except OSError as e:
+            print(f"Unable to write inventory cache {self.inventory_file}: {e}", file=sys.stderr)
+
+    def inventory_diff(self, previous, odata_list):
+        """
+        compare odata_list with the previous inventory of this iLO
+        """
+        old = {odataid: member["record"] for odataid, member in previous.get("members", {}).items()}
+        new = {odata["@odata.id"]: odata for odata in odata_list}
+        return {
+            "since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(previous.get("updated", 0))),
+            "added": [odata for odataid, odata in new.items() if odataid not in old],
+            "removed": [odata for odataid, odata in old.items() if odataid not in new],
+            "changed": [
+                {"@odata.id": odataid, "Name": odata["Name"], "from": old[odataid]["Version"], "to": odata["Version"]}
+                for odataid, odata in new.items()
+                if odataid in old and old[odataid] != odata
+            ],
+        }
+
+    def print_changes(self, changes):
+        """
+        summarize the firmware changes since the previous run on stderr
+        """
+        lines = []
+        for odata in changes["added"]:
+            lines.append(f"  + {odata['Name']} ({odata['Version']})")
+        for odata in changes["removed"]:
+            lines.append(f"  - {odata['Name']} ({odata['Version']})")
+        for change in changes["changed"]:
+            lines.append(f"  ~ {change['Name']}: {change['from']} -> {change['to']}")
+        if lines:
+            print(f"\nFirmware changes since {changes['since']}:", file=sys.stderr)
+            print("\n".join(lines), file=sys.stderr)
+        else:
+            print(f"\nNo firmware changes since {changes['since']}.", file=sys.stderr)
+
+    def fleet_config_parser(self):
+        """
+        read shared iLO credentials and fleet settings; unlike fwlist_config_parser
+        the ilo_address of ~/.fwget.conf is not used
+        """
+        try:
+            with open(self.config_file, "r", encoding="utf-8") as json_config_file:
+                json_config = json.load(json_config_file)
+        except (OSError, ValueError) as e:
+            print(f"Unable to parse {self.config_file}: {e}", file=sys.stderr)
+            sys.exit(1)
+        self.username = json_config.get("ilo_username", "")
+        self.password = json_config.get("ilo_password", "")
+        self.ilo_proxy = json_config.get("ilo_proxy")
+        self.session_cache = json_config.get("session_cache", "no")
+        self.inventory_cache = json_config.get("inventory_cache", "yes")
+        try:
+            self.redfish_workers = max(1, int(json_config.get("redfish_workers", 8)))
+            self.session_idle_timeout = float(json_config.get("session_idle_timeout", 600))
+            self.fleet_concurrency = max(1, int(self.fwlist_options.get("concurrency") or json_config.get("fleet_concurrency", 32)))
+            self.fleet_timeout = float(self.fwlist_options.get("timeout") or json_config.get("fleet_timeout", 30))
+            self.http_config_parser(json_config)
+        except ValueError as e:
+            print(f"Error: invalid fleet setting: {e}", file=sys.stderr)
             sys.exit(1)
 
-        odata_id_list = [odataid["@odata.id"] for odataid in fw_list["Members"]]
-        odata_list = self.odata_parse(odata_id_list, session)
-        return odata_list
+    def fleet_hosts(self, fleet_file):
+        """
+        read the iLO endpoints of a fleet file, see help_menu for its format
+        """
+        try:
+            with open(fleet_file, "r", encoding="utf-8") as hosts_file:
+                content = hosts_file.read()
+        except OSError as e:
+            print(f"Unable to read fleet file {fleet_file}: {e}", file=sys.stderr)
+            sys.exit(1)
+        if content.lstrip().startswith("["):
+            try:
+                return [dict(host) for host in json.loads(content)]
+            except (ValueError, TypeError) as e:
+                print(f"Unable to parse fleet file {fleet_file}: {e}", file=sys.stderr)
+                sys.exit(1)
+        hosts = []
+        for line in content.splitlines():
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            host = {"ilo_address": fields[0]}
+            if len(fields) >= 3:
+                host["ilo_username"], host["ilo_password"] = fields[1], fields[2]
+            hosts.append(host)
+        return hosts
 
-    def odataid_export(self, odata_list: list, fwlist_odataid_output_format="spaced_display") -> None:
+    def fleet_inventory(self, host):
         """
-        write json to file with human-friendly formatting
+        log in to one fleet iLO, read its firmware inventory and log out;
+        return the inventory and the changes since the previous one, or None
         """
+        fwlist = FWList([FWLIST, self.fwlist_odataid_output_format])
+        fwlist.ilo_address = str(host.get("ilo_address", ""))
+        fwlist.username = host.get("ilo_username", self.username)
+        fwlist.password = host.get("ilo_password", self.password)
+        fwlist.ilo_proxy = host.get("ilo_proxy", self.ilo_proxy)
+        fwlist.redfish_workers = self.redfish_workers
+        fwlist.ilo_scheme = self.ilo_scheme
+        fwlist.http_retries = self.http_retries
+        fwlist.http_backoff = self.http_backoff
+        fwlist.session_cache = self.session_cache
+        fwlist.session_idle_timeout = self.session_idle_timeout
+        fwlist.inventory_cache = self.inventory_cache
+        fwlist.inventories = self.inventories
+        fwlist.sessions = self.sessions
+        ipaddress.ip_address(fwlist.ilo_address)
 
-        def odataid_export_in_space(odata_list: list) -> None:
-            output_context = ""
-            for odata in odata_list:
-                for attribute, value in odata.items():
-                    if isinstance(value, list):
-                        output_str = " ".join(value)
-                        output_context += f"\n{attribute}:{output_str}"
+        session = fwlist.redfish_session()
+        # Every request and retry of this iLO, from login to the last member, fits in fleet_timeout
+        session.deadline = time.monotonic() + self.fleet_timeout
+        try:
+            token, session_url = fwlist.redfish_connect(session)
+            if not token:
+                raise Exception("Redfish login failed")
+            return fwlist.firmware_parse(session, session_url), fwlist.inventory_changes
+        except SystemExit:
+            # firmware_parse exits on a malformed inventory, which must not stop the fleet
+            raise Exception("firmware inventory parse error")
+        except Exception:
+            if session.past_deadline():
+                raise Exception(f"no complete inventory within {self.fleet_timeout:g} seconds") from None
+            raise
+        finally:
+            # The logout gets a window of its own, so a slow iLO is not left with an open session
+            session.deadline = time.monotonic() + self.fleet_timeout
+            fwlist.redfish_disconnect(session)
+
+    def fleet_export(self, fleet_file):
+        """
+        inventory many iLOs concurrently, streaming each result as it completes
+        """
+        hosts = self.fleet_hosts(fleet_file)
+        output_dir = self.fwlist_options.get("output-dir")
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        # Read ~/.fwlist.inventory once for the whole fleet and write it back once at the end,
+        # rather than once per iLO
+        use_cache = str(self.inventory_cache).lower() == "yes"
+        if use_cache:
+            self.inventories = self.load_inventories()
+        # The same for ~/.fwlist.session
+        keep_sessions = str(self.session_cache).lower() == "yes"
+        if keep_sessions:
+            self.sessions = self.load_sessions()
+
+        failures = 0
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.fleet_concurrency, len(hosts)))) as executor:
+                futures = {executor.submit(self.fleet_inventory, host): host for host in hosts}
+                for future in as_completed(futures):
+                    ilo_address = str(futures[future].get("ilo_address", ""))
+                    result = {"ilo_address": ilo_address}
+                    try:
+                        firmware, changes = future.result()
+                        result["status"] = "ok"
+                        result["firmware"] = firmware
+                        if changes is not None:
+                            result["changes"] = changes
+                    except Exception as e:
+                        result["status"] = "error"
+                        result["error"] = str(e)
+                        failures += 1
+
+                    if output_dir and result["status"] == "ok":
+                        host_file = os.path.join(output_dir, ilo_address + ".json")
+                        with open(host_file, "w", encoding="utf-8") as f:
+                            json.dump(result["firmware"], f, indent=4, sort_keys=True)
+                        print(f"{ilo_address}: export result to {host_file}", file=sys.stderr)
+                    elif output_dir:
+                        print(f"{ilo_address}: {result['error']}", file=sys.stderr)
                     else:
-                        output_context += f"\n{attribute}:{value}"
-                output_context += "\n"
+                        print(json.dumps(result), flush=True)
+        finally:
+            # Also keeps the inventories already collected when the run is interrupted
+            if use_cache:
+                self.write_inventories(self.inventories)
+            if keep_sessions:
+                self.write_sessions(self.sessions)
 
-            print(output_context)
-            with open(self.odataid_file, "w", encoding="utf-8") as f:
-                print("\nexport result to ", self.odataid_file)
-                f.write(output_context)
+        print(f"{len(hosts) - failures} of {len(hosts)} iLOs inventoried.", file=sys.stderr)
+        return 1 if failures else 0
 
-        def odataid_export_in_json(odata_list: list) -> None:
-            pprint(odata_list)
-            with open(self.odataid_file, "w", encoding="utf-8") as f:
-                print("\nexport result to ", self.odataid_file)
-                json.dump(odata_list, f, indent=4, sort_keys=True)
+    def odataid_output(self):
+        """
+        where the inventory is exported: --output <path>, "-" for stdout only, or ~/.fwlist.output
+        """
+        output = self.fwlist_options.get("output")
+        return os.path.expanduser(output) if output and output != "-" else output or self.odataid_file
 
-        odataid_display_dict = {
-            "spaced_display":odataid_export_in_space,
-            "json_display":odataid_export_in_json}
+    def odataid_output_writable(self) -> bool:
+        """
+        whether the export can be written, checked before logging in so that a
+        bad --output does not fail with the Redfish session open
+        """
+        output = self.odataid_output()
+        if output == "-":
+            return True
+        directory = os.path.dirname(os.path.abspath(output))
+        if os.path.isdir(output) or not os.path.isdir(directory) or not os.access(directory, os.W_OK):
+            print(f"Output error in odataid_export! {output} cannot be written", file=sys.stderr)
+            return False
+        return True
 
+    def odataid_export(self, session, session_url, fwlist_odataid_output_format="spaced_display") -> bool:
+        """
+        parse the firmware inventory and write each component to stdout and the
+        output file in one of FWListExport.FORMATS as soon as its record is parsed;
+        return False if the output could not be written
+        """
         try:
-            odataid_display_dict[fwlist_odataid_output_format](odata_list)
-        except Exception as e:
+            export = FWListExport(self.odataid_output(), fwlist_odataid_output_format)
+            with export:
+                self.firmware_parse(session, session_url, export.write)
+                with TIMINGS.span("output"):
+                    export.close()
+        except (OSError, ValueError) as e:
             print(f"Output error in odataid_export! {e}", file=sys.stderr)
-            print(f"Supported display:{odataid_display_dict.keys()}, Selected display:{fwlist_odataid_output_format}")
+            return False
+        return True
 
 def fwget_version():
     print(f"fwget {FWGET_VER}")
 
 def do_fwget(arglist, argcount):
+    # Answered before anything else is set up; scripts call this a lot
+    if argcount == 2 and arglist[1] in ("-v", "--version"):
+        fwget_version()
+        return
     fwget = FWGet(arglist)
-    valid_fwget_arguments = ["list", "search", "download", "locate"]
+    valid_fwget_arguments = ["list", "search", "download", "locate", "plan", "sync", "verify", "serve", "changes", "query", "cache-serve"]
+    arglist = fwget.fwget_args
+    argcount = len(arglist)
+    TIMINGS.configure(fwget.fwget_options, " ".join([FWGET] + arglist[1:]))
 
     if argcount > 1:
         if arglist[1] == "-v" or arglist[1] == "--version":
@@ -604,32 +4089,51 @@ def do_fwget(arglist, argcount):
         sys.exit(0)
 
 def do_fwlist(arglist, argcount):
+    if argcount == 2 and arglist[1] in ("-v", "--version"):
+        fwget_version()
+        return
     fwlist = FWList(arglist)
-    valid_fwlist_arguments = ["spaced_display", "json_display", ""]
+    valid_fwlist_arguments = list(FWListExport.FORMATS) + [""]
+    arglist = fwlist.fwlist_args
+    argcount = len(arglist)
+    TIMINGS.configure(fwlist.fwlist_options, " ".join([FWLIST] + arglist[1:]))
 
-    if argcount > 1 and (sys.argv[1] == "-v" or sys.argv[1] == "--version"):
+    if argcount > 1 and (arglist[1] == "-v" or arglist[1] == "--version"):
         fwget_version()
-    elif argcount > 1 and (sys.argv[1] == "-h" or sys.argv[1] == "--help" or sys.argv[1] not in valid_fwlist_arguments):
+    elif argcount > 1 and (arglist[1] == "-h" or arglist[1] == "--help" or arglist[1] not in valid_fwlist_arguments):
         fwlist.help_menu()
         sys.exit(0)
-    elif argcount >= 1 and sys.argv[0].endswith(FWLIST):
+    elif argcount >= 1 and arglist[0].endswith(FWLIST) and fwlist.fwlist_options.get("fleet"):
+        fwlist.fleet_config_parser()
+        sys.exit(fwlist.fleet_export(fwlist.fwlist_options["fleet"]))
+    elif argcount >= 1 and arglist[0].endswith(FWLIST):
         fwlist.config_handler(FWLIST)
+        if not fwlist.fwlist_options.get("diff") and not fwlist.odataid_output_writable():
+            sys.exit(1)
 
-        # Create a HTTP session for Redfish API communication
-        session = requests.Session()
-        session.verify = False  # Not for production use
-        token, session_url = fwlist.redfish_login(session)
+        session = fwlist.redfish_session()
+        token, session_url = fwlist.redfish_connect(session)
         if not token:
             print("\n------------- Redfish Login fail -----------------\n")
             return
-        if DEBUG:
-            print("\n------------- Redfish Login succesfully -----------------\n")
 
-        odata_list = fwlist.firmware_parse(session, session_url)
-        fwlist.odataid_export(odata_list, fwlist.fwlist_odataid_output_format)
+        if fwlist.fwlist_options.get("diff"):
+            odata_list = fwlist.firmware_parse(session, session_url)
+            changes = fwlist.inventory_changes
+            # Without a previous inventory, everything is new
+            if changes is None:
+                changes = {"since": None, "added": odata_list, "removed": [], "changed": []}
+            print(json.dumps(dict(changes, ilo_address=fwlist.ilo_address)))
+        else:
+            if not fwlist.odataid_export(session, session_url, fwlist.fwlist_odataid_output_format):
+                fwlist.redfish_disconnect(session)
+                sys.exit(1)
+            if fwlist.inventory_changes is not None:
+                fwlist.print_changes(fwlist.inventory_changes)
 
-        # Log out from Redfish session and invalidate the authentication token
-        fwlist.redfish_logout(session, session_url)
+        # Log out from Redfish session and invalidate the authentication token,
+        # unless it is kept for the next run
+        fwlist.redfish_disconnect(session)
     else:
         print("Unrecongnized command, please use fwlist -h for more info\n")
         sys.exit(0)